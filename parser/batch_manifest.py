@@ -0,0 +1,153 @@
+"""
+批量解析清单
+在输出目录中记录每个脚本的大小、修改时间、内容哈希、解析器版本和解析结果，
+使批量解析只处理新增或变化的脚本，并清理已删除脚本的输出
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Container, Dict, Iterator, List, Tuple
+
+
+MANIFEST_NAME = '_manifest.json'
+
+# 清单格式变化时修改
+_MANIFEST_VERSION = 1
+
+# 影响解析结果或导出内容的模块，内容变化后所有脚本都要重新解析
+_PARSER_MODULES = ('parser.py', 'exporter.py', 'timeline.py')
+
+# 各导出格式额外依赖的模块（sqlite 模式的表结构和行内容由 corpus_db.py 决定）
+_EXPORT_MODULES = {
+    'sqlite': ('corpus_db.py',),
+}
+
+
+def parser_version(export_mode: str = 'indent') -> str:
+    """解析器版本：相关模块（包括导出格式 export_mode 额外依赖的模块）源码的哈希"""
+    digest = hashlib.blake2b(digest_size=8)
+    for name in _PARSER_MODULES + _EXPORT_MODULES.get(export_mode, ()):
+        with open(Path(__file__).parent / name, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def content_hash(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(path: Path) -> Dict[str, Any]:
+    """文件的大小、修改时间和内容哈希（先取 stat 再读内容，读取期间被修改的文件下次会重新比较哈希）"""
+    stat = path.stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': content_hash(path)}
+
+
+class BatchManifest:
+    """
+    输出目录中的 _manifest.json
+
+    每个脚本（以文件名为键）记录 size / mtime_ns / hash、输出文件名和上次的解析结果。
+    判断是否变化时先比较 size 和 mtime，只有不同时才计算哈希；
+    哈希相同（如 git checkout 只改了 mtime）时只更新记录，不重新解析。
+    上次解析失败的脚本总是重新解析。
+    解析器版本或导出格式变化时整个清单作废。
+    """
+
+    def __init__(self, path: Path, version: str, export_mode: str):
+        self.path = Path(path)
+        self.version = version
+        self.export_mode = export_mode
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.changed = False  # 是否有需要保存的修改
+
+    @classmethod
+    def load(cls, path: Path, version: str, export_mode: str) -> 'BatchManifest':
+        """读取清单，不存在、损坏或版本不一致时返回空清单"""
+        manifest = cls(path, version, export_mode)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        if (isinstance(data, dict) and data.get('manifest_version') == _MANIFEST_VERSION
+                and data.get('parser_version') == version and data.get('export_mode') == export_mode):
+            manifest.entries = data.get('files', {})
+        return manifest
+
+    def plan(self, files: List[Path]) -> Tuple[List[Tuple[Path, Dict[str, Any]]], List[str]]:
+        """
+        对比当前的脚本文件
+
+        Returns:
+            (需要解析的文件及其指纹, 已删除的脚本名)
+        """
+        pending = []
+        names = set()
+        for path in files:
+            try:
+                self._plan_file(path, pending)
+            except FileNotFoundError:
+                # 列出目录之后被删除（如 git pull 途中），按已删除处理
+                continue
+            names.add(path.name)
+
+        removed = [name for name in self.entries if name not in names]
+        return pending, removed
+
+    def _plan_file(self, path: Path, pending: List[Tuple[Path, Dict[str, Any]]]):
+        entry = self.entries.get(path.name)
+        # 上次解析或写出失败的脚本（可能是磁盘已满等暂时性错误）每次都重试
+        if entry is None or not entry['result']['success']:
+            pending.append((path, fingerprint(path)))
+            return
+
+        stat = path.stat()
+        output_exists = (self.path.parent / entry['output']).exists()
+        if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns'] and output_exists:
+            return
+
+        current = fingerprint(path)
+        if current['hash'] == entry['hash'] and output_exists:
+            entry.update(current)
+            self.changed = True
+        else:
+            pending.append((path, current))
+
+    def update(self, name: str, file_fingerprint: Dict[str, Any], output: str, result: Dict[str, Any]):
+        self.entries[name] = dict(file_fingerprint, output=output, result=result)
+        self.changed = True
+
+    def remove(self, name: str) -> Dict[str, Any]:
+        self.changed = True
+        return self.entries.pop(name)
+
+    def results(self, skip: Container[str] = ()) -> Iterator[Dict[str, Any]]:
+        """按文件名排序的解析结果（跳过 skip 中的脚本）"""
+        for name in sorted(self.entries):
+            if name not in skip:
+                yield self.entries[name]['result']
+
+    def save(self):
+        """写入清单（先写临时文件再替换，中途中断不会留下半个清单）"""
+        data = {
+            'manifest_version': _MANIFEST_VERSION,
+            'parser_version': self.version,
+            'export_mode': self.export_mode,
+            'files': self.entries,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+            self.changed = False
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
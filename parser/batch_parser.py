@@ -2,98 +2,413 @@
 批量解析所有脚本文件
 """
 
+import argparse
+import multiprocessing
+import os
+import queue
 import sys
+import threading
+import time
 from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from parser import ADVScriptParser
+from batch_manifest import MANIFEST_NAME, BatchManifest, parser_version
+from batch_report import REPORT_NDJSON, BatchReport
+from batch_shard import parse_shard_spec, shard_files
+from corpus_db import DATABASE_NAME, CorpusDatabaseWriter, merge_databases, script_rows
+from exporter import write_output
+from script_watcher import ScriptWatcher
+from parse_cache import ParseCache
+from parser_stats import STATS
 import json
+import shutil
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import traceback
 
 
+# 流水线各阶段之间队列的容量（文件数）
+PIPELINE_DEPTH = 4
+
+# 流水线阶段 -> 说明
+PIPELINE_STAGES = {
+    'read': '预读',
+    'parse': '解析',
+    'write': '写出',
+}
+
+
 class BatchParser:
     """批量解析器"""
     
-    def __init__(self, resource_dir: Path, output_dir: Path):
+    def __init__(self, resource_dir: Path, output_dir: Path, cache: Optional[ParseCache] = None,
+                 export_mode: str = 'indent'):
         self.resource_dir = Path(resource_dir)
         self.output_dir = Path(output_dir)
+        self.cache = cache  # 解析结果缓存（可选）
+        self.export_mode = export_mode  # indent / compact / ndjson / sqlite（所有脚本写入同一个数据库）
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()  # 每个线程复用自己的解析器
+        self.report: Optional[BatchReport] = None  # 最近一次 parse_all 的报告
+        self._stage_times: Dict[str, float] = {}
         
         self.stats = {
             'total': 0,
             'success': 0,
             'failed': 0,
-            'errors': []
+            'parsed': 0,  # 本次实际解析的文件数
+            'unchanged': 0,
+            'removed': 0,
+            'errors': [],
+            'stages': {}  # 流水线各阶段的忙碌时间和利用率
         }
     
+    def _get_parser(self) -> ADVScriptParser:
+        """当前线程复用的解析器（parse_file 每次都会重置状态）"""
+        parser = getattr(self._local, 'parser', None)
+        if parser is None:
+            parser = self._local.parser = ADVScriptParser(cache=self.cache)
+        return parser
+    
+    def _output_path(self, file_path: Path) -> Path:
+        if self.export_mode == 'sqlite':
+            return self.output_dir / DATABASE_NAME
+        suffix = '.ndjson' if self.export_mode == 'ndjson' else '.json'
+        return self.output_dir / f"{file_path.stem}{suffix}"
+    
     def parse_single_file(self, file_path: Path) -> dict:
         """解析单个文件"""
+        results, _ = self.parse_files([file_path])
+        return results[0]
+    
+    def parse_files(self, file_paths: List[Path]) -> Tuple[List[dict], Dict[str, float]]:
+        """
+        以流水线方式解析一批文件（见 run_pipeline）
+        
+        Returns:
+            (结果列表, 各阶段的忙碌时间和总耗时 wall，单位秒)
+        """
+        tasks: queue.Queue = queue.Queue()
+        tasks.put(list(file_paths))
+        tasks.put(None)
+        results: List[dict] = []
+        stage_times = self.run_pipeline(tasks, results.append)
+        return results, stage_times
+    
+    def run_pipeline(self, tasks: Any, emit: Callable[[dict], Any]) -> Dict[str, float]:
+        """
+        以流水线方式依次解析 tasks 中的各批文件，直到取到 None
+        
+        预读线程取出文件列表并读取 → 当前线程解析并在内存中生成输出 → 写出线程写入磁盘后以结果记录调用 emit，
+        各阶段之间是容量为 PIPELINE_DEPTH 的有界队列，磁盘读写与解析重叠进行。
+        三个阶段在整个运行期间只启动一次：上一批的最后几个文件解析和写出时已经在预读下一批，
+        只有一个大文件的批次也能与前后的批次重叠。
+        
+        Args:
+            tasks: 文件列表的队列（queue.Queue 或 multiprocessing 的队列）
+            emit: 按文件顺序，在每个文件写出（或解析失败）后调用
+        
+        Returns:
+            各阶段的忙碌时间和总耗时 wall（秒）
+        """
+        started = time.perf_counter()
+        busy = dict.fromkeys(PIPELINE_STAGES, 0.0)
+        read_queue: queue.Queue = queue.Queue(maxsize=PIPELINE_DEPTH)
+        write_queue: queue.Queue = queue.Queue(maxsize=PIPELINE_DEPTH)
+        write_errors: List[BaseException] = []
+        
+        def read():
+            try:
+                while True:
+                    file_paths = tasks.get()
+                    if file_paths is None:
+                        return
+                    for file_path in file_paths:
+                        read_started = time.perf_counter()
+                        try:
+                            with open(file_path, 'rb') as f:
+                                item = (file_path, f.read(), None)
+                        except OSError as e:
+                            item = (file_path, None, e)
+                        elapsed = time.perf_counter() - read_started
+                        busy['read'] += elapsed
+                        if STATS.enabled and item[1] is not None:
+                            STATS.record('read', elapsed, elapsed, size=len(item[1]))
+                        read_queue.put(item)
+            finally:
+                read_queue.put(None)
+        
+        def write():
+            while True:
+                item = write_queue.get()
+                if item is None:
+                    return
+                if write_errors:
+                    continue  # 出错后只取出队列中的内容，避免解析阶段阻塞
+                result, output_path, payload = item
+                try:
+                    if payload is not None:
+                        write_started = time.perf_counter()
+                        try:
+                            write_output(output_path, payload)
+                        except OSError as e:
+                            result.update(success=False, error=str(e), traceback=traceback.format_exc())
+                        busy['write'] += time.perf_counter() - write_started
+                    emit(result)
+                except BaseException as e:
+                    write_errors.append(e)
+        
+        reader = threading.Thread(target=read, name='batch-reader', daemon=True)
+        writer = threading.Thread(target=write, name='batch-writer', daemon=True)
+        reader.start()
+        writer.start()
+        
+        try:
+            while True:
+                item = read_queue.get()
+                if item is None:
+                    break
+                file_path, data, error = item
+                parse_started = time.perf_counter()
+                result, payload = self._parse_one(file_path, data, error)
+                busy['parse'] += time.perf_counter() - parse_started
+                write_queue.put((result, self._output_path(file_path), payload))
+        finally:
+            write_queue.put(None)
+            writer.join()
+        reader.join()
+        if write_errors:
+            raise write_errors[0]
+        
+        busy['wall'] = time.perf_counter() - started
+        return busy
+    
+    def _parse_one(self, file_path: Path, data: Optional[bytes], error: Optional[BaseException] = None
+                   ) -> Tuple[dict, Any]:
+        """解析预读的文件内容，返回 (结果记录, 待写出的输出内容)；sqlite 模式和解析失败时输出为 None"""
         try:
-            parser = ADVScriptParser()
-            commands = parser.parse_file(file_path)
+            if error is not None:
+                raise error
+            parser = self._get_parser()
+            commands = parser.parse_file(file_path, data)
             summary = parser.get_timeline_summary()
             messages = parser.get_messages()
             
-            # 保存JSON
-            output_file = self.output_dir / f"{file_path.stem}.json"
-            parser.export_to_json(output_file)
-            
-            return {
+            result = {
                 'success': True,
                 'file': file_path.name,
                 'commands': len(commands),
                 'duration': summary.get('duration', 0),
                 'messages': len(messages)
             }
+            
+            if self.export_mode == 'sqlite':
+                # 数据库只由主进程的写入线程写入，这里只转换为各表的行
+                result['rows'] = script_rows(commands)
+                return result, None
+            # 在内存中生成JSON，由写出线程保存
+            return result, parser.dump_json(self.export_mode)
         except Exception as e:
             return {
                 'success': False,
                 'file': file_path.name,
                 'error': str(e),
                 'traceback': traceback.format_exc()
-            }
+            }, None
     
-    def parse_all(self, max_workers: int = 8):
-        """并行解析所有文件"""
+    def parse_all(self, max_workers: Optional[int] = None, use_processes: bool = True, chunk_size: int = 8,
+                  chunk_bytes: int = 1024 * 1024, largest_first: bool = True, progress: bool = True,
+                  force: bool = False, shard: Optional[Tuple[int, int]] = None):
+        """
+        并行解析新增或变化的文件
+        
+        输出目录中的 _manifest.json 记录了每个脚本上次解析时的指纹和结果，
+        未变化的脚本直接沿用，已删除脚本的输出会被清理。
+        所有脚本的结果逐条写入 _batch_report.ndjson（未变化的在前，新解析的按完成顺序在后），
+        内存中只保留累计值，汇总报告由 generate_report 生成。
+        
+        Args:
+            max_workers: 并行数，默认为CPU核数
+            use_processes: 使用进程池（解析是纯Python的CPU密集型工作，线程会被GIL串行化）；
+                           False 时使用线程池
+            chunk_size: 每个任务最多包含的文件数，减少任务调度的开销
+            chunk_bytes: 每个任务最多包含的源文件字节数（超过的大文件单独成为一个任务），0 表示不限制
+            largest_first: 从最大的文件开始调度，避免几个大文件排在最后时其他工作进程空等
+            progress: 是否打印进度
+            force: 忽略清单，重新解析所有文件
+            shard: (i, N)：只解析按大小均衡分成 N 份后的第 i 份（从1开始），各分片应使用不同的输出目录
+        
+        Returns:
+            统计信息（同 self.stats）
+        """
+        manifest_path = self.output_dir / MANIFEST_NAME
+        if force:
+            manifest = BatchManifest(manifest_path, parser_version(self.export_mode), self.export_mode)
+        else:
+            manifest = BatchManifest.load(manifest_path, parser_version(self.export_mode), self.export_mode)
+        
         # 获取所有txt文件
-        txt_files = list(self.resource_dir.glob('*.txt'))
-        self.stats['total'] = len(txt_files)
+        txt_files = sorted(self.resource_dir.glob('*.txt'))
+        if shard is not None:
+            txt_files = shard_files(txt_files, *shard)
+        pending, removed = manifest.plan(txt_files)
+        
+        # 清理已删除脚本的输出
+        for name in removed:
+            entry = manifest.remove(name)
+            if self.export_mode != 'sqlite':
+                (self.output_dir / entry['output']).unlink(missing_ok=True)
+        
+        database = None
+        if self.export_mode == 'sqlite':
+            if not manifest.entries:
+                # 清单作废（如解析器或表结构变化）时所有脚本都会重新写入，旧数据库的表结构可能已经不同，直接重建
+                for suffix in ('', '-wal', '-shm'):
+                    (self.output_dir / (DATABASE_NAME + suffix)).unlink(missing_ok=True)
+            database = CorpusDatabaseWriter(self.output_dir / DATABASE_NAME).start()
+            # 清单丢失或重建时数据库中可能残留已删除的脚本
+            database.prune(file_path.name for file_path in txt_files)
+            if removed:
+                database.remove(removed)
+        
+        if progress:
+            shard_note = f"（分片 {shard[0]}/{shard[1]}）" if shard is not None else ''
+            print(f"📁 找到 {len(txt_files)} 个脚本文件{shard_note}")
+            if shard is not None and not txt_files:
+                print(f"⚠ 分片 {shard[0]}/{shard[1]} 没有分到脚本（分片数多于脚本数）")
+            print(f"📂 输出目录: {self.output_dir}")
+            print(f"🔄 需要解析 {len(pending)} 个，未变化 {len(txt_files) - len(pending)} 个，已删除 {len(removed)} 个")
+        
+        fingerprints = {file_path.name: file_fingerprint for file_path, file_fingerprint in pending}
+        self._stage_times = dict.fromkeys(list(PIPELINE_STAGES) + ['wall'], 0.0)
+        try:
+            with BatchReport(self.output_dir) as report:
+                for result in manifest.results(skip=fingerprints):
+                    report.add(result)
+                
+                if pending:
+                    if largest_first:
+                        pending.sort(key=lambda item: item[1]['size'], reverse=True)
+                    chunks = _make_chunks([(file_path, fp['size']) for file_path, fp in pending],
+                                          chunk_size, chunk_bytes)
+                    for result in self._parse_chunks(chunks, len(pending), max_workers, use_processes, progress):
+                        name = result['file']
+                        rows = result.pop('rows', None)
+                        if database is not None:
+                            if rows is not None:
+                                database.put(name, result, rows)
+                            else:
+                                database.remove([name])
+                        manifest.update(name, fingerprints[name], self._output_path(Path(name)).name, result)
+                        report.add(result)
+        finally:
+            if database is not None:
+                database.close()
+        
+        # 没有分到脚本的分片也要留下清单，merge 时才能识别
+        if manifest.changed or not manifest_path.exists():
+            manifest.save()
+        
+        self.report = report
+        self.stats.update(total=report.totals['total'], success=report.totals['success'],
+                          failed=report.totals['failed'], parsed=len(pending),
+                          unchanged=len(txt_files) - len(pending), removed=len(removed), errors=report.errors)
+        wall = self._stage_times['wall']
+        self.stats['stages'] = {stage: {'busy': self._stage_times[stage],
+                                        'utilization': self._stage_times[stage] / wall if wall else 0.0}
+                                for stage in PIPELINE_STAGES}
+        return self.stats
+    
+    def _add_stage_times(self, stage_times: Dict[str, float]):
+        for stage, seconds in stage_times.items():
+            self._stage_times[stage] += seconds
+    
+    def _parse_chunks(self, chunks: List[List[Path]], total: int, max_workers: Optional[int], use_processes: bool,
+                      progress: bool) -> Iterator[dict]:
+        """
+        并行解析各任务中的文件，按完成顺序产出结果
         
-        print(f"📁 找到 {len(txt_files)} 个脚本文件")
-        print(f"📂 输出目录: {self.output_dir}")
-        print(f"🔧 使用 {max_workers} 个线程并行处理\n")
+        每个工作者（进程或线程）运行一条长期的流水线（run_pipeline），从共享的任务队列中按 chunks 的顺序取任务；
+        队列中最多排着并行数两倍的任务：工作者始终有活可干，而未开始的任务不会在内存中堆积。
+        结果在写出后逐个传回。
+        """
+        if len(chunks) == 1:
+            # 只有一个任务时直接在当前进程中解析，省去启动进程池的开销（监视模式下通常每次只有几个文件）
+            chunk_results, stage_times = self.parse_files(chunks[0])
+            self._add_stage_times(stage_times)
+            yield from chunk_results
+            return
         
-        results = []
+        max_workers = min(max_workers or os.cpu_count() or 1, len(chunks))
+        if progress:
+            print(f"🔧 使用 {max_workers} 个{'进程' if use_processes else '线程'}并行处理\n")
         
-        # 使用线程池并行处理
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
-            futures = {executor.submit(self.parse_single_file, f): f for f in txt_files}
+        if use_processes:
+            # 进程池：每个工作进程持有自己的解析器和流水线，只传回很小的结果记录
+            tasks = multiprocessing.Queue(maxsize=max_workers * 2)
+            results = multiprocessing.Queue()
+            executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                           initargs=self._worker_args() + (tasks, results))
+            run_worker = _worker_main
+        else:
+            tasks = queue.Queue(maxsize=max_workers * 2)
+            results = queue.Queue()
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            run_worker = lambda: _run_worker(self, tasks, results, False)
+        
+        def feed():
+            for chunk in chunks:
+                tasks.put(chunk)
+            for _ in range(max_workers):
+                tasks.put(None)
+        
+        threading.Thread(target=feed, name='batch-feeder', daemon=True).start()
+        
+        with executor:
+            # 每个工作者运行到取到 None 为止，max_workers 个任务各占一个工作者
+            workers = [executor.submit(run_worker) for _ in range(max_workers)]
+            finished = 0
             
             # 使用tqdm显示进度
-            with tqdm(total=len(txt_files), desc="解析进度", unit="文件") as pbar:
-                for future in as_completed(futures):
-                    result = future.result()
-                    results.append(result)
+            with tqdm(total=total, desc="解析进度", unit="文件", disable=not progress) as pbar:
+                while finished < max_workers:
+                    try:
+                        message = results.get(timeout=1.0)
+                    except queue.Empty:
+                        # 工作者出错退出时不会再发出消息，在这里抛出它的异常
+                        for worker in workers:
+                            if worker.done():
+                                worker.result()
+                        continue
                     
-                    if result['success']:
-                        self.stats['success'] += 1
-                    else:
-                        self.stats['failed'] += 1
-                        self.stats['errors'].append({
-                            'file': result['file'],
-                            'error': result['error']
-                        })
-                    
-                    pbar.update(1)
-        
-        return results
+                    if message[0] == 'result':
+                        yield message[1]
+                        pbar.update(1)
+                        continue
+                    _, stage_times, worker_stats = message
+                    finished += 1
+                    self._add_stage_times(stage_times)
+                    if worker_stats is not None:
+                        STATS.merge(worker_stats)
     
-    def generate_report(self, results: list):
-        """生成分析报告"""
+    def _worker_args(self) -> Tuple[Any, ...]:
+        """重建工作进程中的批量解析器所需的参数（缓存对象含锁，不能直接传给子进程）"""
+        cache_dir = self.cache.cache_dir if self.cache is not None else None
+        cache_max_bytes = self.cache.max_bytes if self.cache is not None else 0
+        return (self.resource_dir, self.output_dir, cache_dir, cache_max_bytes, self.export_mode, STATS.enabled)
+    
+    def _success_rate(self) -> float:
+        """成功率（百分比），没有脚本时（如脚本目录为空）为 0"""
+        total = self.stats['total']
+        return self.stats['success'] / total * 100 if total else 0.0
+    
+    def generate_report(self, verbose: bool = True):
+        """由 parse_all 的累计值生成汇总报告（逐个脚本的结果在 _batch_report.ndjson 中）"""
+        totals = self.report.totals
         report = {
             'statistics': self.stats,
-            'files': results
+            'totals': totals,
+            'files': REPORT_NDJSON
         }
         
         # 保存报告
@@ -111,13 +426,14 @@ class BatchParser:
             f.write(f"总文件数: {self.stats['total']}\n")
             f.write(f"成功: {self.stats['success']}\n")
             f.write(f"失败: {self.stats['failed']}\n")
-            f.write(f"成功率: {self.stats['success']/self.stats['total']*100:.2f}%\n\n")
+            f.write(f"成功率: {self._success_rate():.2f}%\n")
+            f.write(f"本次解析: {self.stats['parsed']}（未变化 {self.stats['unchanged']}，已删除 {self.stats['removed']}）\n\n")
             
             if self.stats['errors']:
                 f.write("=" * 60 + "\n")
                 f.write("错误列表:\n")
                 f.write("=" * 60 + "\n")
-                for error in self.stats['errors'][:10]:  # 只显示前10个错误
+                for error in self.stats['errors']:  # 只保留了前10个错误
                     f.write(f"\n文件: {error['file']}\n")
                     f.write(f"错误: {error['error']}\n")
             
@@ -126,9 +442,9 @@ class BatchParser:
             f.write("统计信息:\n")
             f.write("=" * 60 + "\n")
             
-            total_commands = sum(r.get('commands', 0) for r in results if r['success'])
-            total_duration = sum(r.get('duration', 0) for r in results if r['success'])
-            total_messages = sum(r.get('messages', 0) for r in results if r['success'])
+            total_commands = totals['commands']
+            total_duration = totals['duration']
+            total_messages = totals['messages']
             
             f.write(f"总命令数: {total_commands:,}\n")
             f.write(f"总时长: {total_duration:,.2f} 秒 ({total_duration/60:.2f} 分钟)\n")
@@ -138,12 +454,98 @@ class BatchParser:
                 f.write(f"平均每个脚本命令数: {total_commands/self.stats['success']:.1f}\n")
                 f.write(f"平均每个脚本时长: {total_duration/self.stats['success']:.1f} 秒\n")
         
-        print(f"\n✓ 报告已生成:")
-        print(f"  - JSON: {report_file}")
-        print(f"  - TXT: {readable_report}")
+        if verbose:
+            print(f"\n✓ 报告已生成:")
+            print(f"  - JSON: {report_file}")
+            print(f"  - TXT: {readable_report}")
+            print(f"  - 逐个脚本: {self.output_dir / REPORT_NDJSON}")
+        
+        if STATS.enabled:
+            # 分阶段统计（--stats 或 ADV_PARSER_STATS=1）
+            stats_file = self.output_dir / '_parser_stats.json'
+            with open(stats_file, 'w', encoding='utf-8') as f:
+                json.dump(STATS.to_dict(), f, ensure_ascii=False, indent=2)
+            if verbose:
+                print(f"  - 分阶段统计: {stats_file}")
         
         return report
     
+    def merge_shards(self, shard_dirs: List[Path]):
+        """
+        把各分片的输出目录合并到本输出目录
+        
+        复制各分片的输出文件（sqlite 模式下合并数据库），合并清单，再由合并后的清单重新生成报告；
+        之后可以在本目录上继续增量解析。各分片必须使用相同的解析器版本和导出格式。
+        
+        Returns:
+            统计信息（同 self.stats）
+        """
+        version = parser_version(self.export_mode)
+        manifest = BatchManifest.load(self.output_dir / MANIFEST_NAME, version, self.export_mode)
+        databases = []
+        for shard_dir in map(Path, shard_dirs):
+            with open(shard_dir / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('parser_version') != version or data.get('export_mode') != self.export_mode:
+                raise ValueError(f"分片 {shard_dir} 的解析器版本或导出格式与当前不一致 "
+                                 f"({data.get('parser_version')}/{data.get('export_mode')}，"
+                                 f"当前 {version}/{self.export_mode})")
+            
+            for name, entry in data['files'].items():
+                if self.export_mode != 'sqlite' and entry['result']['success']:
+                    shutil.copy2(shard_dir / entry['output'], self.output_dir / entry['output'])
+                manifest.entries[name] = entry
+            if self.export_mode == 'sqlite':
+                databases.append(shard_dir / DATABASE_NAME)
+        
+        if databases:
+            merge_databases(self.output_dir / DATABASE_NAME, databases)
+        manifest.save()
+        
+        with BatchReport(self.output_dir) as report:
+            for result in manifest.results():
+                report.add(result)
+        
+        self.report = report
+        self.stats.update(total=report.totals['total'], success=report.totals['success'],
+                          failed=report.totals['failed'], parsed=0, unchanged=report.totals['total'], removed=0,
+                          errors=report.errors)
+        return self.stats
+    
+    def watch(self, max_workers: Optional[int] = None, use_processes: bool = True, debounce: float = 0.2,
+              poll_interval: float = 0.25, use_watchdog: bool = True):
+        """
+        监视脚本目录，脚本新增、修改或删除时只重新解析受影响的脚本并更新报告，按 Ctrl+C 退出
+        
+        一连串的变化在 debounce 秒内没有新变化后合并处理；未安装 watchdog 时每 poll_interval 秒扫描一次目录。
+        """
+        self.parse_all(max_workers, use_processes)
+        self.generate_report()
+        self.print_summary()
+        
+        with ScriptWatcher(self.resource_dir, poll_interval=poll_interval, use_watchdog=use_watchdog) as watcher:
+            print(f"\n👀 正在监视 {self.resource_dir}（{watcher.mode}），按 Ctrl+C 退出")
+            try:
+                while True:
+                    # 带超时等待，Windows 上无限期等待时按 Ctrl+C 不会立即生效
+                    if not watcher.wait_for_changes(debounce, timeout=0.5):
+                        continue
+                    start = time.perf_counter()
+                    try:
+                        stats = self.parse_all(max_workers, use_processes, progress=False)
+                        if not stats['parsed'] and not stats['removed']:
+                            continue
+                        self.generate_report(verbose=False)
+                    except Exception as e:
+                        # 出错（如 git pull 途中文件被删除、输出目录暂时不可写）时继续监视，下一次变化时重试
+                        print(f"✗ {time.strftime('%H:%M:%S')} 更新失败: {e}")
+                        traceback.print_exc()
+                        continue
+                    print(f"🔄 {time.strftime('%H:%M:%S')} 解析 {stats['parsed']} 个，删除 {stats['removed']} 个，"
+                          f"失败 {stats['failed']} 个（{(time.perf_counter() - start) * 1000:.0f} 毫秒）")
+            except KeyboardInterrupt:
+                print("\n✓ 已停止监视")
+    
     def print_summary(self):
         """打印摘要"""
         print("\n" + "=" * 60)
@@ -152,25 +554,127 @@ class BatchParser:
         print(f"总文件数: {self.stats['total']}")
         print(f"成功: {self.stats['success']} ✓")
         print(f"失败: {self.stats['failed']} ✗")
-        print(f"成功率: {self.stats['success']/self.stats['total']*100:.2f}%")
+        print(f"成功率: {self._success_rate():.2f}%")
+        print(f"本次解析: {self.stats['parsed']}（未变化 {self.stats['unchanged']}，已删除 {self.stats['removed']}）")
+        if self.stats['parsed']:
+            utilization = '  '.join(f"{label} {self.stats['stages'][stage]['utilization']:.0%}"
+                                    for stage, label in PIPELINE_STAGES.items())
+            print(f"流水线各阶段利用率: {utilization}")
+
+
+def _make_chunks(files: List[Tuple[Path, int]], chunk_size: int, chunk_bytes: int) -> List[List[Path]]:
+    """按顺序把 (文件, 字节数) 分成任务，每个任务最多 chunk_size 个文件、chunk_bytes 字节（chunk_bytes 为 0 时不限制）"""
+    chunks = []
+    chunk: List[Path] = []
+    chunk_total = 0
+    for file_path, size in files:
+        if chunk and (len(chunk) >= chunk_size or (chunk_bytes and chunk_total + size > chunk_bytes)):
+            chunks.append(chunk)
+            chunk = []
+            chunk_total = 0
+        chunk.append(file_path)
+        chunk_total += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+# 进程池工作进程内的批量解析器（每个进程一个，解析器在整个进程生命周期内复用）和任务、结果队列
+_worker: Optional[BatchParser] = None
+_tasks: Any = None
+_results: Any = None
+
+
+def _init_worker(resource_dir: Path, output_dir: Path, cache_dir: Optional[Path], cache_max_bytes: int,
+                 export_mode: str, stats_enabled: bool, tasks: Any, results: Any):
+    global _worker, _tasks, _results
+    cache = ParseCache(cache_dir, cache_max_bytes) if cache_dir is not None else None
+    _worker = BatchParser(resource_dir, output_dir, cache=cache, export_mode=export_mode)
+    _tasks, _results = tasks, results
+    if stats_enabled:
+        STATS.enable()
+
+
+def _run_worker(batch_parser: BatchParser, tasks: Any, results: Any, collect_stats: bool):
+    """
+    运行一个工作者的流水线，直到从 tasks 中取到 None
+    
+    每个文件的结果以 ('result', 结果记录) 放入 results，
+    结束时放入 ('done', 流水线各阶段的耗时, 分阶段统计)（collect_stats 为 False 时统计为 None）
+    """
+    stage_times = batch_parser.run_pipeline(tasks, lambda result: results.put(('result', result)))
+    worker_stats = None
+    if collect_stats:
+        worker_stats = STATS.to_dict()
+        STATS.reset()
+    results.put(('done', stage_times, worker_stats))
+
+
+def _worker_main():
+    """进程池中的工作者"""
+    _run_worker(_worker, _tasks, _results, STATS.enabled)
 
 
 def main():
+    arg_parser = argparse.ArgumentParser(description='批量解析ADV脚本')
+    arg_parser.add_argument('--stats', action='store_true',
+                            help='记录各解析阶段的耗时（也可以设置环境变量 ADV_PARSER_STATS=1）')
+    arg_parser.add_argument('--workers', type=int, default=None, help='并行数（默认为CPU核数）')
+    arg_parser.add_argument('--threads', action='store_true', help='使用线程池代替进程池')
+    arg_parser.add_argument('--force', action='store_true', help='忽略 _manifest.json，重新解析所有文件')
+    arg_parser.add_argument('--watch', action='store_true',
+                            help='解析后继续监视脚本目录，只重新解析变化的脚本（安装 watchdog 时使用系统通知）')
+    arg_parser.add_argument('--export-mode', choices=['indent', 'compact', 'ndjson', 'sqlite'], default='indent',
+                            help=f'输出格式：每个脚本一个JSON文件，或 sqlite（全部写入 {DATABASE_NAME}）')
+    arg_parser.add_argument('--shard', metavar='i/N',
+                            help='只解析按大小均衡分成 N 份后的第 i 份，默认输出到 output-shard-i-of-N')
+    arg_parser.add_argument('--output-dir', type=Path, help='输出目录（默认为项目根目录下的 output）')
+    subparsers = arg_parser.add_subparsers(dest='action')
+    merge = subparsers.add_parser('merge', help='把各分片的输出目录合并到输出目录')
+    merge.add_argument('shard_dirs', nargs='+', type=Path, help='分片的输出目录')
+    args = arg_parser.parse_args()
+    if args.stats:
+        STATS.enable()
+    
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard_spec(args.shard)
+        except ValueError as e:
+            arg_parser.error(str(e))
+    
     # 配置路径 - 使用 submodule 数据源
-    resource_dir = Path(__file__).parent.parent / "gakumas-data" / "data"
-    output_dir = Path(__file__).parent.parent / "output"
+    project_dir = Path(__file__).parent.parent
+    resource_dir = project_dir / "gakumas-data" / "data"
+    output_dir = args.output_dir
+    if output_dir is None:
+        output_dir = project_dir / (f"output-shard-{shard[0]}-of-{shard[1]}" if shard else "output")
+    
+    # 创建批量解析器（解析结果缓存在项目根目录的 .cache/parse 下）
+    batch_parser = BatchParser(resource_dir, output_dir, cache=ParseCache(), export_mode=args.export_mode)
     
-    # 创建批量解析器
-    batch_parser = BatchParser(resource_dir, output_dir)
+    if args.action == 'merge':
+        batch_parser.merge_shards(args.shard_dirs)
+        batch_parser.generate_report()
+        batch_parser.print_summary()
+        return
+    
+    if args.watch:
+        batch_parser.watch(max_workers=args.workers, use_processes=not args.threads)
+        return
     
     # 解析所有文件
-    results = batch_parser.parse_all(max_workers=8)
+    batch_parser.parse_all(max_workers=args.workers, use_processes=not args.threads, force=args.force, shard=shard)
     
     # 生成报告
-    batch_parser.generate_report(results)
+    batch_parser.generate_report()
     
     # 打印摘要
     batch_parser.print_summary()
+    
+    if STATS.enabled:
+        print()
+        print(STATS.format_report())
 
 
 if __name__ == "__main__":
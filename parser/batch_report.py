@@ -0,0 +1,79 @@
+"""
+流式批量解析报告
+每个脚本的解析结果完成时立即追加到 NDJSON 报告中，内存中只保留累计值和前几个错误，
+汇总报告（_batch_report.json / .txt）由累计值生成
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+REPORT_NDJSON = '_batch_report.ndjson'
+
+# 汇总中保留的错误数，完整的错误信息在 NDJSON 报告中
+MAX_ERRORS = 10
+
+
+class BatchReport:
+    """
+    NDJSON 报告写入器
+
+    写入临时文件，close 时替换 _batch_report.ndjson，中途中断时保留上一次的完整报告。
+    可以作为上下文管理器使用。
+    """
+
+    def __init__(self, output_dir: Path):
+        self.path = Path(output_dir) / REPORT_NDJSON
+        self.totals = {
+            'total': 0,
+            'success': 0,
+            'failed': 0,
+            'commands': 0,
+            'duration': 0.0,
+            'messages': 0,
+        }
+        self.errors: List[Dict[str, str]] = []
+        self._file = None
+        self._tmp_path = None
+
+    def open(self) -> 'BatchReport':
+        fd, self._tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        self._file = os.fdopen(fd, 'w', encoding='utf-8')
+        return self
+
+    def add(self, result: Dict[str, Any]):
+        """写入一个脚本的结果并更新累计值"""
+        self._file.write(json.dumps(result, ensure_ascii=False))
+        self._file.write('\n')
+
+        totals = self.totals
+        totals['total'] += 1
+        if result['success']:
+            totals['success'] += 1
+            totals['commands'] += result.get('commands', 0)
+            totals['duration'] += result.get('duration', 0)
+            totals['messages'] += result.get('messages', 0)
+        else:
+            totals['failed'] += 1
+            if len(self.errors) < MAX_ERRORS:
+                self.errors.append({'file': result['file'], 'error': result['error']})
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        os.unlink(self._tmp_path)
+
+    def __enter__(self) -> 'BatchReport':
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,37 @@
+"""
+分片批量解析
+把脚本按大小均衡地分成 N 份，每台机器（或容器）只解析其中一份，最后用 merge 合并输出和报告
+"""
+
+import heapq
+from pathlib import Path
+from typing import List, Tuple
+
+
+def parse_shard_spec(spec: str) -> Tuple[int, int]:
+    """解析 'i/N'（1 <= i <= N）"""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"分片格式应为 i/N: {spec}") from None
+    if not 1 <= index <= count:
+        raise ValueError(f"分片序号应在 1 到 {count} 之间: {spec}")
+    return index, count
+
+
+def shard_files(files: List[Path], index: int, count: int) -> List[Path]:
+    """
+    第 index 份（从1开始，共 count 份）分到的文件
+
+    从大到小依次分给当前总大小最小的分片，各分片的总大小接近；
+    同样的文件集合在任何机器上分出的结果都相同。
+    """
+    sized = sorted(((path.stat().st_size, path.name, path) for path in files), key=lambda item: (-item[0], item[1]))
+    loads = [(0, shard) for shard in range(1, count + 1)]
+    selected = []
+    for size, _, path in sized:
+        load, shard = heapq.heappop(loads)
+        if shard == index:
+            selected.append(path)
+        heapq.heappush(loads, (load + size, shard))
+    return sorted(selected)
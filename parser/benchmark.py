@@ -0,0 +1,760 @@
+"""
+解析器性能基准测试
+在真实语料 (gakumas-data/data) 上测量解析吞吐量
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import exporter
+from batch_parser import BatchParser
+from corpus_pack import PackedCorpus, pack_corpus
+from incremental import IncrementalDocument
+from parse_cache import ParseCache
+from parser import ADVScriptParser
+from synthetic import ScriptShape, axis_shapes, write_script
+from timeline import TimelineView
+
+try:
+    import resource  # 只在类Unix系统上可用，用于读取峰值RSS
+except ImportError:
+    resource = None
+
+
+DEFAULT_DATA_DIR = Path(__file__).parent.parent / "gakumas-data" / "data"
+
+
+def _legacy_scan_commands(content: str) -> Iterator[Tuple[int, int, str, int, int]]:
+    """旧版逐字符扫描（仅作为基准对照）"""
+    i = 0
+    while i < len(content):
+        if content[i] == '[':
+            start_pos = i
+            i += 1
+
+            command_start = i
+            while i < len(content) and content[i] not in ' \t\n\r]':
+                i += 1
+            command_type = content[command_start:i]
+
+            while i < len(content) and content[i] in ' \t\n\r':
+                i += 1
+
+            params_start = i
+            depth = 1
+            escape_next = False
+
+            while i < len(content) and depth > 0:
+                if escape_next:
+                    escape_next = False
+                    i += 1
+                    continue
+
+                char = content[i]
+                if char == '\\':
+                    escape_next = True
+                elif char == '[':
+                    depth += 1
+                elif char == ']':
+                    depth -= 1
+                    if depth == 0:
+                        yield start_pos, i + 1, command_type, params_start, i
+                        break
+                i += 1
+        else:
+            i += 1
+
+
+def load_corpus(data_dir: Path, limit: int = 0) -> List[Tuple[Path, str]]:
+    """读取语料文件内容"""
+    files = sorted(Path(data_dir).glob('*.txt'))
+    if limit:
+        files = files[:limit]
+
+    corpus = []
+    for file_path in files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            corpus.append((file_path, f.read()))
+    return corpus
+
+
+def _best_of(func: Callable[[], None], repeat: int) -> float:
+    """多次运行取最短耗时"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_scan(corpus: List[Tuple[Path, str]], repeat: int = 3) -> Dict[str, float]:
+    """对比逐字符扫描与跳跃式扫描"""
+    scanner = ADVScriptParser()
+
+    # 两种扫描器必须给出完全相同的结果
+    for file_path, content in corpus:
+        if list(_legacy_scan_commands(content)) != list(scanner._scan_commands(content)):
+            raise AssertionError(f"扫描结果不一致: {file_path.name}")
+
+    def run_legacy():
+        for _, content in corpus:
+            for _ in _legacy_scan_commands(content):
+                pass
+
+    def run_jump():
+        for _, content in corpus:
+            for _ in scanner._scan_commands(content):
+                pass
+
+    legacy_time = _best_of(run_legacy, repeat)
+    jump_time = _best_of(run_jump, repeat)
+
+    return {
+        'files': len(corpus),
+        'legacy_files_per_sec': len(corpus) / legacy_time,
+        'jump_files_per_sec': len(corpus) / jump_time,
+        'speedup': legacy_time / jump_time,
+    }
+
+
+def bench_parse_file(corpus: List[Tuple[Path, str]], repeat: int = 3) -> Dict[str, float]:
+    """测量完整 parse_file 的吞吐量"""
+    parser = ADVScriptParser()
+
+    def run():
+        for file_path, _ in corpus:
+            parser.parse_file(file_path)
+
+    def run_few_keys():
+        # 批量扫描只读取少数参数，其余参数值不会被切片或反转义
+        for file_path, _ in corpus:
+            for command in parser.parse_file(file_path):
+                command.params.get('id')
+
+    elapsed = _best_of(run, repeat)
+    few_keys_elapsed = _best_of(run_few_keys, repeat)
+    total_bytes = sum(len(content.encode('utf-8')) for _, content in corpus)
+
+    return {
+        'files': len(corpus),
+        'files_per_sec': len(corpus) / elapsed,
+        'mb_per_sec': total_bytes / elapsed / 1024 / 1024,
+        'few_keys_files_per_sec': len(corpus) / few_keys_elapsed,
+    }
+
+
+def bench_cache(corpus: List[Tuple[Path, str]], repeat: int = 3) -> Dict[str, float]:
+    """比较无缓存、缓存未命中（解析+写入）与缓存命中的吞吐量"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ParseCache(Path(cache_dir))
+
+        def run(use_cache: bool):
+            for file_path, _ in corpus:
+                ADVScriptParser(cache=cache if use_cache else None).parse_file(file_path)
+
+        plain_time = _best_of(lambda: run(False), repeat)
+        start = time.perf_counter()
+        run(True)
+        miss_time = time.perf_counter() - start
+        hit_time = _best_of(lambda: run(True), repeat)
+        cache_bytes = sum(path.stat().st_size for path in Path(cache_dir).glob('*.bin'))
+
+    source_bytes = sum(len(content.encode('utf-8')) for _, content in corpus)
+    return {
+        'plain_files_per_sec': len(corpus) / plain_time,
+        'miss_files_per_sec': len(corpus) / miss_time,
+        'hit_files_per_sec': len(corpus) / hit_time,
+        'speedup': plain_time / hit_time,
+        'size_ratio': cache_bytes / source_bytes,
+    }
+
+
+def _legacy_export(parser: ADVScriptParser, output_path: Path):
+    """旧版导出：拼出整个文档后一次性 json.dump（仅作为基准对照）"""
+    data = {
+        "commands": [
+            {
+                "type": cmd.command_type,
+                "params": parser._clean_params(cmd.params),
+                "clip": asdict(cmd.clip) if cmd.clip else None
+            }
+            for cmd in parser.commands
+        ],
+        "summary": parser.get_timeline_summary()
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def bench_export(corpus: List[Tuple[Path, str]], repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """比较旧版导出与各种流式导出格式的吞吐量和输出大小"""
+    parsers = []
+    for file_path, _ in corpus:
+        parser = ADVScriptParser()
+        parser.parse_file(file_path)
+        parsers.append(parser)
+
+    def legacy(parser, path):
+        _legacy_export(parser, path)
+
+    def streaming(mode, use_orjson=True):
+        def export(parser, path):
+            commands = (parser._command_to_dict(cmd) for cmd in parser.commands)
+            exporter.write_json(path, commands, parser.get_timeline_summary(), mode, use_orjson)
+        return export
+
+    variants = {'legacy': legacy}
+    for mode in exporter.EXPORT_MODES:
+        variants[mode] = streaming(mode, use_orjson=False)
+        if mode != 'indent' and exporter.orjson is not None:
+            variants[f'{mode}+orjson'] = streaming(mode)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, export in variants.items():
+            paths = [Path(output_dir) / f"{name}_{i}.json" for i in range(len(parsers))]
+            elapsed = _best_of(lambda: [export(parser, path) for parser, path in zip(parsers, paths)], repeat)
+            results[name] = {
+                'files_per_sec': len(parsers) / elapsed,
+                'bytes': sum(path.stat().st_size for path in paths),
+            }
+    return results
+
+
+def bench_pack(corpus: List[Tuple[Path, str]]) -> Dict[str, float]:
+    """比较逐个读取JSON输出与打包语料：打开+读取单个脚本、读取整个语料（毫秒）"""
+    scripts = []
+    for file_path, _ in corpus:
+        parser = ADVScriptParser()
+        parser.parse_file(file_path)
+        scripts.append((file_path.stem, parser))
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_dir = Path(output_dir)
+        for name, parser in scripts:
+            parser.export_to_json(output_dir / f"{name}.json")
+        pack_path = output_dir / "corpus.pack"
+        pack_corpus(pack_path, ((name, parser.commands) for name, parser in scripts))
+
+        target = scripts[len(scripts) // 2][0]
+
+        def read_json(names):
+            for name in names:
+                with open(output_dir / f"{name}.json", 'r', encoding='utf-8') as f:
+                    json.load(f)
+
+        def read_pack(names):
+            with PackedCorpus(pack_path) as packed:
+                for name in names:
+                    packed[name]
+
+        names = [name for name, _ in scripts]
+        results = {
+            'json_one_ms': _best_of(lambda: read_json([target]), 5) * 1000,
+            'pack_one_ms': _best_of(lambda: read_pack([target]), 5) * 1000,
+            'json_all_ms': _best_of(lambda: read_json(names), 3) * 1000,
+            'pack_all_ms': _best_of(lambda: read_pack(names), 3) * 1000,
+            'json_bytes': sum(path.stat().st_size for path in output_dir.glob('*.json')),
+            'pack_bytes': pack_path.stat().st_size,
+        }
+    return results
+
+
+def bench_incremental(corpus: List[Tuple[Path, str]], edits: int = 200) -> Dict[str, float]:
+    """在最长的脚本中间逐字输入，比较每次增量更新与完整解析的耗时（微秒）"""
+    _, content = max(corpus, key=lambda item: len(item[1]))
+
+    start = time.perf_counter()
+    document = IncrementalDocument(content)
+    full_time = time.perf_counter() - start
+
+    offset = content.find('text=', len(content) // 2)
+    offset = offset + 5 if offset != -1 else len(content) // 2
+    start = time.perf_counter()
+    for i in range(edits):
+        document.apply_edit(offset + i, 0, 'あ')
+    edit_time = (time.perf_counter() - start) / edits
+
+    return {
+        'commands': len(document),
+        'full_parse_us': full_time * 1e6,
+        'edit_us': edit_time * 1e6,
+    }
+
+
+def bench_memory(corpus: List[Tuple[Path, str]]) -> Dict[str, float]:
+    """用 tracemalloc 测量整个语料解析结果常驻内存的大小（MB）"""
+    results = {'source_text': sum(sys.getsizeof(content) for _, content in corpus) / 1024 / 1024}
+
+    for name, compact in (('default', False), ('compact', True)):
+        tracemalloc.start()
+        parsed = []
+        for file_path, _ in corpus:
+            parsed.append(ADVScriptParser(compact=compact).parse_file(file_path))
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del parsed
+
+        results[name] = current / 1024 / 1024
+        results[f'{name}_peak'] = peak / 1024 / 1024
+
+    return results
+
+
+def bench_parse_peak(corpus: List[Tuple[Path, str]]) -> Dict[str, float]:
+    """逐个文件解析后立即丢弃，比较文本模式与 mmap 字节模式的峰值内存（KB）"""
+    results = {}
+    for name, use_mmap in (('text', False), ('mmap', True)):
+        parser = ADVScriptParser(use_mmap=use_mmap)
+        tracemalloc.start()
+        for file_path, _ in corpus:
+            parser.parse_file(file_path)
+            parser.commands = []
+        results[name] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return results
+
+
+def bench_timeline(corpus: List[Tuple[Path, str]]) -> Dict[str, float]:
+    """整个语料的时间轴统计耗时（毫秒）：构建列式视图 + 合并后统计"""
+    views = []
+    parsers = []
+    for file_path, _ in corpus:
+        parser = ADVScriptParser()
+        parser.parse_file(file_path)
+        views.append(parser.timeline_view())
+        parsers.append(parser)
+
+    start = time.perf_counter()
+    merged = TimelineView.merge(views)
+    merge_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    merged.total_duration()
+    merged.type_counts()
+    merged.actor_screen_time()
+    merged.overlap_counts()
+    stats_time = time.perf_counter() - start
+
+    # 每个文件在时间轴上均匀取100个时刻，比较逐条扫描与区间索引
+    queries = [(parser, [view.total_duration() * i / 100 for i in range(100)])
+               for parser, view in zip(parsers, views)]
+
+    start = time.perf_counter()
+    for parser, times in queries:
+        for t in times:
+            [cmd for cmd in parser.commands
+             if cmd.clip and cmd.clip.startTime <= t <= cmd.clip.startTime + cmd.clip.duration]
+    scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for parser, _ in queries:
+        parser.interval_index()
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for parser, times in queries:
+        for t in times:
+            parser.get_active_commands(t)
+    index_time = time.perf_counter() - start
+
+    query_count = sum(len(times) for _, times in queries)
+    return {
+        'clips': len(merged.start),
+        'merge_ms': merge_time * 1000,
+        'stats_ms': stats_time * 1000,
+        'index_build_ms': build_time * 1000,
+        'scan_query_us': scan_time * 1e6 / query_count,
+        'index_query_us': index_time * 1e6 / query_count,
+    }
+
+
+_CLIP = '\\{"_startTime":0.0,"_duration":1.0,"_easeInDuration":0.0,"_easeOutDuration":0.0\\}'
+
+
+def _worker_counts(max_workers: int) -> List[int]:
+    """1, 2, 4, ... 直到 max_workers（包含 max_workers 本身）"""
+    counts = []
+    count = 1
+    while count < max_workers:
+        counts.append(count)
+        count *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def _batch_run(data_dir: Path, options: Dict[str, Any], queue: Any):
+    """在独立进程中运行一次批量解析，把墙钟时间和峰值RSS（本进程 / 工作进程中最大的，MB）放入 queue"""
+    with tempfile.TemporaryDirectory() as output_dir:
+        batch = BatchParser(data_dir, output_dir)
+        start = time.perf_counter()
+        batch.parse_all(progress=False, **options)
+        elapsed = time.perf_counter() - start
+
+    result = {'seconds': elapsed, 'files_per_sec': batch.stats['total'] / elapsed,
+              'utilization': {stage: stats['utilization'] for stage, stats in batch.stats['stages'].items()}}
+    if resource is not None:
+        # ru_maxrss 在 Linux 上以KB为单位，macOS 上以字节为单位
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        result['parent_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+        result['worker_rss_mb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    queue.put(result)
+
+
+def _run_batch_isolated(data_dir: Path, options: Dict[str, Any]) -> Dict[str, float]:
+    """每次运行使用新进程，峰值RSS互不影响"""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_batch_run, args=(data_dir, options, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def bench_batch(data_dir: Path, max_workers: int = 0) -> Dict[str, Dict[str, float]]:
+    """完整语料的批量解析（解析 + 导出JSON）：进程池从1个进程到CPU核数的墙钟时间和加速比，以及同等线程数的线程池"""
+    max_workers = max_workers or os.cpu_count() or 1
+    runs = [(f'processes_{count}', count, True) for count in _worker_counts(max_workers)]
+    runs.append((f'threads_{max_workers}', max_workers, False))
+
+    results = {}
+    for name, workers, use_processes in runs:
+        result = _run_batch_isolated(data_dir, {'max_workers': workers, 'use_processes': use_processes})
+        results[name] = dict(result, workers=workers)
+
+    baseline = results['processes_1']['seconds']
+    for result in results.values():
+        result['speedup'] = baseline / result['seconds']
+    return results
+
+
+def bench_batch_skewed(max_workers: int = 0, small: int = 200, large: int = 4) -> Dict[str, Dict[str, float]]:
+    """
+    偏斜语料（大量小脚本 + 按文件名排在最后的几个超大脚本）上的调度对比：
+    按文件名顺序每8个文件一个任务，与从大到小、按大小分组的调度
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    runs = {
+        'name_order': {'largest_first': False, 'chunk_bytes': 0},
+        'largest_first': {'largest_first': True},
+    }
+
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        data_dir = Path(data_dir)
+        for index in range(small):
+            write_script(data_dir / f"adv_small_{index:04d}.txt", ScriptShape(commands=200, seed=index))
+        for index in range(large):
+            write_script(data_dir / f"adv_zz_large_{index}.txt", ScriptShape(commands=8_000, seed=index))
+
+        for name, options in runs.items():
+            results[name] = _run_batch_isolated(data_dir, dict(options, max_workers=max_workers))
+    return results
+
+
+def make_long_params(size: int) -> Dict[str, str]:
+    """生成不同形态的超长参数字符串（每个约 size 字符）"""
+    message_text = ('麻央先輩、ありがとう！\\r\\n' * (size // 16 + 1))[:size]
+    entry = '\\{"position":\\{"x":0.0,"y":1.2999999523162842,"z":1.6\\},"name":"\\"cam\\""\\}'
+    entries = ','.join([entry] * (size // len(entry) + 1))
+    structured_pairs = ' '.join(f'k{i}=\\{{"v":{i}\\}}' for i in range(size // 12 + 1))
+    plain_pairs = ' '.join(f'key{i}=value{i}' for i in range(size // 16 + 1))
+
+    return {
+        'long_message': f'text={message_text} name=麻央 clip={_CLIP}',
+        'nested_setting': f'setting=\\{{"items":\\[{entries}\\]\\}} clip={_CLIP}',
+        'many_structured': f'{structured_pairs} clip={_CLIP}',
+        'many_plain': plain_pairs,
+    }
+
+
+def bench_params(sizes: List[int], repeat: int = 5) -> Dict[str, Dict[int, float]]:
+    """测量 _parse_params 在超长参数上的耗时（微秒/KB），线性实现应与长度无关"""
+    parser = ADVScriptParser()
+    results: Dict[str, Dict[int, float]] = {}
+
+    for size in sizes:
+        for name, params_str in make_long_params(size).items():
+            elapsed = _best_of(lambda: parser._parse_params(params_str), repeat)
+            kilobytes = len(params_str) / 1024
+            results.setdefault(name, {})[size] = elapsed * 1e6 / kilobytes
+
+    return results
+
+
+def bench_synthetic_script(file_path: Path, repeat: int = 3) -> Dict[str, float]:
+    """单个合成脚本：parse_file / _parse_params / export_to_json 的吞吐量（MB/秒）与解析内存"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    megabytes = file_path.stat().st_size / 1024 / 1024
+    parser = ADVScriptParser()
+
+    parse_time = _best_of(lambda: parser.parse_file(file_path), repeat)
+    commands = len(parser.commands)
+
+    # 与旧版逐条解析相同：每条命令的参数字符串完整交给 _parse_params
+    params_strings = [content[span[3]:span[4]].strip() for span in parser._scan_commands(content)]
+    params_megabytes = sum(len(params.encode('utf-8')) for params in params_strings) / 1024 / 1024
+    params_time = _best_of(lambda: [parser._parse_params(params) for params in params_strings], repeat)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_path = Path(output_dir) / 'out.json'
+        export_time = _best_of(lambda: parser.export_to_json(output_path), repeat)
+        export_megabytes = output_path.stat().st_size / 1024 / 1024
+
+    parser = ADVScriptParser()
+    tracemalloc.start()
+    parser.parse_file(file_path)
+    resident, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'source_mb': megabytes,
+        'commands': commands,
+        'parse_mb_per_sec': megabytes / parse_time,
+        'parse_commands_per_sec': commands / parse_time,
+        'params_mb_per_sec': params_megabytes / params_time,
+        'export_mb_per_sec': export_megabytes / export_time,
+        'resident_mb': resident / 1024 / 1024,
+        'peak_mb': peak / 1024 / 1024,
+    }
+
+
+def bench_synthetic(repeat: int = 3, base: ScriptShape = ScriptShape()) -> Dict[str, Dict[int, Dict[str, float]]]:
+    """在合成脚本上逐个维度放大规模（见 synthetic.AXES）"""
+    results: Dict[str, Dict[int, Dict[str, float]]] = {}
+    with tempfile.TemporaryDirectory() as script_dir:
+        for axis, value, shape in axis_shapes(base):
+            file_path = write_script(Path(script_dir) / f"{axis}_{value}.txt", shape)
+            results.setdefault(axis, {})[value] = bench_synthetic_script(file_path, repeat)
+            file_path.unlink()
+    return results
+
+
+def _flatten(results: Any, prefix: str = '') -> Dict[str, float]:
+    """嵌套结果展开为 {'suite.key.subkey': 数值}"""
+    if isinstance(results, dict):
+        flat = {}
+        for key, value in results.items():
+            flat.update(_flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+        return flat
+    if isinstance(results, (int, float)) and not isinstance(results, bool):
+        return {prefix: results}
+    return {}
+
+
+def compare_results(old: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.05) -> List[Tuple[str, float, float]]:
+    """对比两次运行（--json 输出），返回变化超过 threshold 的 (指标, 旧值, 新值)"""
+    old_flat = _flatten(old.get('suites', {}))
+    new_flat = _flatten(new.get('suites', {}))
+    changes = []
+    for key, new_value in new_flat.items():
+        old_value = old_flat.get(key)
+        if old_value and abs(new_value - old_value) / abs(old_value) > threshold:
+            changes.append((key, old_value, new_value))
+    return changes
+
+
+def _run_metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    """记录运行环境，便于对比不同版本的结果"""
+    try:
+        commit: Optional[str] = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).parent,
+                                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'suites': args.suites,
+        'repeat': args.repeat,
+        'data_dir': str(args.data_dir),
+    }
+
+
+SUITES = ('params', 'synthetic', 'scan', 'parse', 'cache', 'incremental', 'export', 'pack', 'memory', 'timeline',
+          'batch')
+
+# 不需要真实语料的测试
+SYNTHETIC_SUITES = {'params', 'synthetic'}
+
+
+def save_results(args: argparse.Namespace, results: Dict[str, Any]):
+    """--json 保存结果，--compare 打印与旧结果相比变化超过5%的指标"""
+    run = {'meta': _run_metadata(args), 'suites': results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(run, f, ensure_ascii=False, indent=2)
+        print(f"\n✓ 结果已保存: {args.json}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        changes = compare_results(old, run)
+        print(f"\n与 {args.compare} ({old['meta'].get('commit') or '?'}) 对比，变化超过5%的指标:")
+        for key, old_value, new_value in changes:
+            print(f"  {key:<60} {old_value:12,.3f} → {new_value:12,.3f} ({new_value / old_value - 1:+.1%})")
+        if not changes:
+            print("  （无）")
+
+
+def run_suites(args: argparse.Namespace, results: Dict[str, Any]):
+    """运行选中的测试并打印，结果同时写入 results"""
+    if 'params' in args.suites:
+        params = results['params'] = bench_params(args.param_sizes)
+        print("_parse_params 超长参数 (微秒/KB):")
+        for name, by_size in params.items():
+            cells = '  '.join(f"{size // 1000}K: {cost:8.2f}" for size, cost in by_size.items())
+            print(f"  {name:<16} {cells}")
+        print()
+
+    if 'synthetic' in args.suites:
+        synthetic = results['synthetic'] = bench_synthetic(args.repeat)
+        print("合成脚本 (逐个维度放大，其余维度为默认值; 吞吐量单位 MB/秒):")
+        for axis, by_value in synthetic.items():
+            for value, result in by_value.items():
+                print(f"  {axis + '=' + str(value):<22} {result['source_mb']:7.2f} MB  "
+                      f"parse_file {result['parse_mb_per_sec']:6.2f}  _parse_params {result['params_mb_per_sec']:6.2f}  "
+                      f"导出 {result['export_mb_per_sec']:6.2f}  峰值内存 {result['peak_mb']:7.2f} MB")
+        print()
+
+    if not set(args.suites) - SYNTHETIC_SUITES:
+        return
+
+    corpus = load_corpus(args.data_dir, args.limit)
+    if not corpus:
+        print(f"✗ 未找到脚本文件: {args.data_dir}")
+        return
+
+    print(f"📁 语料: {args.data_dir} ({len(corpus)} 个文件)\n")
+
+    if 'scan' in args.suites:
+        scan = results['scan'] = bench_scan(corpus, args.repeat)
+        print("命令扫描:")
+        print(f"  逐字符扫描: {scan['legacy_files_per_sec']:,.1f} 文件/秒")
+        print(f"  跳跃式扫描: {scan['jump_files_per_sec']:,.1f} 文件/秒")
+        print(f"  加速比: {scan['speedup']:.2f}x\n")
+
+    if 'parse' in args.suites:
+        parse = results['parse'] = bench_parse_file(corpus, args.repeat)
+        print("parse_file:")
+        print(f"  {parse['files_per_sec']:,.1f} 文件/秒 ({parse['mb_per_sec']:.2f} MB/秒)")
+        print(f"  只读取 id 参数: {parse['few_keys_files_per_sec']:,.1f} 文件/秒\n")
+
+    if 'cache' in args.suites:
+        cache = results['cache'] = bench_cache(corpus, args.repeat)
+        print("解析缓存:")
+        print(f"  无缓存:   {cache['plain_files_per_sec']:,.1f} 文件/秒")
+        print(f"  未命中:   {cache['miss_files_per_sec']:,.1f} 文件/秒")
+        print(f"  命中:     {cache['hit_files_per_sec']:,.1f} 文件/秒 ({cache['speedup']:.1f}x)")
+        print(f"  缓存大小: 源文件的 {cache['size_ratio']:.2f} 倍\n")
+
+    if 'incremental' in args.suites:
+        incremental = results['incremental'] = bench_incremental(corpus)
+        print(f"增量解析 (最长脚本, {incremental['commands']:,} 条命令):")
+        print(f"  完整解析: {incremental['full_parse_us']:,.1f} 微秒")
+        print(f"  每次编辑: {incremental['edit_us']:,.1f} 微秒\n")
+
+    if 'export' in args.suites:
+        export = results['export'] = bench_export(corpus, args.repeat)
+        legacy_bytes = export['legacy']['bytes']
+        print("JSON导出:")
+        for name, result in export.items():
+            print(f"  {name:<15} {result['files_per_sec']:8,.1f} 文件/秒  "
+                  f"{result['bytes'] / 1024 / 1024:7.2f} MB ({result['bytes'] / legacy_bytes:.0%})")
+        print()
+
+    if 'pack' in args.suites:
+        pack = results['pack'] = bench_pack(corpus)
+        print("打包语料 (对比逐个读取JSON输出):")
+        print(f"  打开并读取单个脚本: JSON {pack['json_one_ms']:.2f} 毫秒, 打包 {pack['pack_one_ms']:.2f} 毫秒")
+        print(f"  读取整个语料:       JSON {pack['json_all_ms']:.2f} 毫秒, 打包 {pack['pack_all_ms']:.2f} 毫秒")
+        print(f"  大小: JSON {pack['json_bytes'] / 1024 / 1024:.2f} MB, 打包 {pack['pack_bytes'] / 1024 / 1024:.2f} MB\n")
+
+    if 'memory' in args.suites:
+        memory = results['memory'] = bench_memory(corpus)
+        print("解析结果常驻内存 (tracemalloc):")
+        print(f"  源文本:   {memory['source_text']:8.2f} MB")
+        print(f"  默认模式: {memory['default']:8.2f} MB (峰值 {memory['default_peak']:.2f} MB)")
+        print(f"  紧凑模式: {memory['compact']:8.2f} MB (峰值 {memory['compact_peak']:.2f} MB)")
+
+        peak = results['parse_peak'] = bench_parse_peak(corpus)
+        print("逐文件解析峰值内存:")
+        print(f"  文本模式: {peak['text']:10.1f} KB")
+        print(f"  mmap模式: {peak['mmap']:10.1f} KB\n")
+
+    if 'timeline' in args.suites:
+        timeline = results['timeline'] = bench_timeline(corpus)
+        print(f"语料时间轴统计 ({timeline['clips']:,} 个clip):")
+        print(f"  合并视图: {timeline['merge_ms']:.2f} 毫秒")
+        print(f"  统计: {timeline['stats_ms']:.2f} 毫秒")
+        print(f"  区间索引构建: {timeline['index_build_ms']:.2f} 毫秒")
+        print(f"  时刻查询: 逐条扫描 {timeline['scan_query_us']:.1f} 微秒/次, "
+              f"区间索引 {timeline['index_query_us']:.1f} 微秒/次")
+
+    if 'batch' in args.suites:
+        batch = results['batch'] = bench_batch(args.data_dir, args.workers)
+        print("\n批量解析 (完整语料, 解析 + 导出JSON):")
+        for name, result in batch.items():
+            print(f"  {name:<14} {result['seconds']:8.2f} 秒  {result['files_per_sec']:8,.1f} 文件/秒  "
+                  f"加速比 {result['speedup']:.2f}x{_format_rss(result)}")
+            print(f"  {'':<14} 流水线利用率 " + '  '.join(f"{stage} {value:.0%}"
+                                                    for stage, value in result['utilization'].items()))
+
+        skewed = results['batch_skewed'] = bench_batch_skewed(args.workers)
+        print("偏斜语料的调度 (200个小脚本 + 4个超大脚本):")
+        for name, result in skewed.items():
+            print(f"  {name:<14} {result['seconds']:8.2f} 秒{_format_rss(result)}")
+
+
+def _format_rss(result: Dict[str, float]) -> str:
+    if 'parent_rss_mb' not in result:
+        return ''
+    return f"  峰值RSS 主进程 {result['parent_rss_mb']:.1f} MB / 工作进程 {result['worker_rss_mb']:.1f} MB"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='ADV脚本解析器基准测试')
+    arg_parser.add_argument('suites', nargs='*', metavar='SUITE',
+                            help=f"要运行的测试: {', '.join(SUITES)}（默认全部）")
+    arg_parser.add_argument('--data-dir', type=Path, default=DEFAULT_DATA_DIR, help='脚本目录')
+    arg_parser.add_argument('--limit', type=int, default=0, help='最多读取的文件数 (0 表示全部)')
+    arg_parser.add_argument('--repeat', type=int, default=3, help='重复次数（取最好成绩）')
+    arg_parser.add_argument('--param-sizes', type=int, nargs='+', default=[10_000, 40_000, 160_000],
+                            help='参数微基准的字符串长度')
+    arg_parser.add_argument('--workers', type=int, default=0, help='批量解析测试的最大并行数 (0 表示CPU核数)')
+    arg_parser.add_argument('--json', type=Path, metavar='PATH', help='把结果保存为JSON')
+    arg_parser.add_argument('--compare', type=Path, metavar='PATH', help='与之前 --json 保存的结果对比')
+    args = arg_parser.parse_args()
+
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        arg_parser.error(f"未知的测试: {', '.join(sorted(unknown))}")
+    args.suites = args.suites or list(SUITES)
+
+    results: Dict[str, Any] = {}
+    try:
+        run_suites(args, results)
+    finally:
+        # 中途失败时也保存已完成的部分
+        save_results(args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+语料数据库
+把批量解析的结果写入单个 SQLite 数据库（脚本、命令、参数、clip、对话、资源引用），
+全语料的查询（如哪些脚本用到了某个动作）可以直接用带索引的SQL完成，不需要逐个读取JSON
+"""
+
+import argparse
+import queue
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from parser import ClipData, Command
+from timeline import get_actor_id
+
+
+DATABASE_NAME = 'corpus.db'
+
+# 以这些前缀开头的参数值视为资源名（模型、动作、场景、音频、转场、图片、视频）
+RESOURCE_PREFIXES = ('mdl_', 'mot_', 'env_', 'sud_', 'ttn_', 'img_', 'mov_')
+
+# 命令在脚本内按深度优先的顺序编号（seq），嵌套命令记录父命令的 seq 和所在的参数名
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scripts (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    commands INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    messages INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS commands (
+    script_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    parent_seq INTEGER,
+    parent_key TEXT,
+    type TEXT NOT NULL,
+    actor_id TEXT,
+    PRIMARY KEY (script_id, seq)
+);
+CREATE TABLE IF NOT EXISTS params (
+    script_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (script_id, seq, key)
+);
+CREATE TABLE IF NOT EXISTS clips (
+    script_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    start_time REAL,
+    duration REAL,
+    clip_in REAL,
+    ease_in_duration REAL,
+    ease_out_duration REAL,
+    blend_in_duration REAL,
+    blend_out_duration REAL,
+    mix_in_ease_type INTEGER,
+    time_scale REAL,
+    PRIMARY KEY (script_id, seq)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    script_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    time REAL,
+    name TEXT,
+    text TEXT,
+    se TEXT,
+    PRIMARY KEY (script_id, seq)
+);
+CREATE TABLE IF NOT EXISTS resources (
+    script_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (script_id, seq, key)
+);
+CREATE INDEX IF NOT EXISTS idx_commands_type ON commands(type);
+CREATE INDEX IF NOT EXISTS idx_commands_actor ON commands(actor_id);
+CREATE INDEX IF NOT EXISTS idx_resources_name ON resources(name);
+'''
+
+_TABLES = ('commands', 'params', 'clips', 'messages', 'resources')
+
+_INSERTS = {
+    'commands': 'INSERT INTO commands VALUES (?, ?, ?, ?, ?, ?)',
+    'params': 'INSERT INTO params VALUES (?, ?, ?, ?)',
+    'clips': f"INSERT INTO clips VALUES (?, ?{', ?' * len(ClipData.__slots__)})",
+    'messages': 'INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)',
+    'resources': 'INSERT INTO resources VALUES (?, ?, ?, ?)',
+}
+
+
+def script_rows(commands: Iterable[Command]) -> Dict[str, List[tuple]]:
+    """
+    把一个脚本的命令转换为各表的行（不含 script_id，由写入线程补上）
+
+    在工作进程中调用，返回值只包含字符串和数值，可以直接传回主进程。
+    """
+    rows: Dict[str, List[tuple]] = {table: [] for table in _TABLES}
+    stack: List[Tuple[Command, Optional[int], Optional[str]]] = [(command, None, None) for command in commands]
+    stack.reverse()
+    seq = 0
+    while stack:
+        command, parent_seq, parent_key = stack.pop()
+        actor_id = get_actor_id(command)
+        if not isinstance(actor_id, str):  # 嵌套命令列表等非字符串值不作为角色
+            actor_id = None
+        rows['commands'].append((seq, parent_seq, parent_key, command.command_type, actor_id))
+
+        children = []
+        for key, value in command.params.items():
+            if isinstance(value, list):
+                children.extend((child, seq, key) for child in value)
+                continue
+            rows['params'].append((seq, key, value))
+            if isinstance(value, str) and value.startswith(RESOURCE_PREFIXES):
+                rows['resources'].append((seq, key, value))
+
+        clip = command.clip
+        if clip is not None:
+            rows['clips'].append((seq, *(getattr(clip, field) for field in ClipData.__slots__)))
+        if command.command_type == 'message':
+            params = command.params
+            rows['messages'].append((seq, clip.startTime if clip else None, params.get('name', ''),
+                                     params.get('text', ''), params.get('se', '')))
+
+        stack.extend(reversed(children))
+        seq += 1
+    return rows
+
+
+class CorpusDatabaseWriter:
+    """
+    单线程写入语料数据库
+
+    put / remove / prune 只把操作放入有界队列，由唯一的写入线程执行，
+    每写入约 batch_rows 行提交一次事务。
+    重新写入同一个脚本时先删除它原有的行。
+    """
+
+    def __init__(self, path: Path, batch_rows: int = 200_000, queue_size: int = 64):
+        self.path = Path(path)
+        self.batch_rows = batch_rows
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+
+    def start(self) -> 'CorpusDatabaseWriter':
+        self._thread = threading.Thread(target=self._run, name='corpus-db-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def put(self, name: str, summary: Dict[str, Any], rows: Dict[str, List[tuple]]):
+        """写入一个脚本（summary 包含 commands / duration / messages）"""
+        self._submit(('put', name, summary, rows))
+
+    def remove(self, names: Iterable[str]):
+        """删除脚本"""
+        self._submit(('remove', list(names)))
+
+    def prune(self, keep: Iterable[str]):
+        """删除不在 keep 中的脚本"""
+        self._submit(('prune', set(keep)))
+
+    def _submit(self, item: tuple):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(item)
+
+    def close(self):
+        """等待队列中的操作全部写入，写入线程出错时在这里抛出"""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> 'CorpusDatabaseWriter':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        try:
+            conn = sqlite3.connect(self.path)
+        except sqlite3.Error as e:
+            self._error = e
+            self._drain()
+            return
+
+        closing = False  # 已取到结束标记（之后出错时队列中不会再有标记，不能再等待）
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_SCHEMA)
+            pending_rows = 0
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    closing = True
+                    break
+                pending_rows += self._apply(conn, item)
+                if pending_rows >= self.batch_rows:
+                    conn.commit()
+                    pending_rows = 0
+            conn.commit()
+        except BaseException as e:
+            self._error = e
+            if not closing:
+                self._drain()
+        finally:
+            conn.close()
+
+    def _drain(self):
+        """出错后继续取出队列中的操作，避免 put 一直阻塞"""
+        while self._queue.get() is not None:
+            pass
+
+    def _apply(self, conn: sqlite3.Connection, item: tuple) -> int:
+        """执行一个操作，返回写入的行数"""
+        action = item[0]
+        if action == 'remove':
+            for name in item[1]:
+                self._delete(conn, name)
+            return len(item[1])
+
+        if action == 'prune':
+            names = [name for (name,) in conn.execute('SELECT name FROM scripts') if name not in item[1]]
+            for name in names:
+                self._delete(conn, name)
+            return len(names)
+
+        _, name, summary, rows = item
+        self._delete(conn, name)
+        script_id = conn.execute(
+            'INSERT INTO scripts (name, commands, duration, messages) VALUES (?, ?, ?, ?)',
+            (name, summary['commands'], summary['duration'], summary['messages'])).lastrowid
+        count = 1
+        for table in _TABLES:
+            table_rows = rows[table]
+            conn.executemany(_INSERTS[table], [(script_id, *row) for row in table_rows])
+            count += len(table_rows)
+        return count
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, name: str):
+        row = conn.execute('SELECT id FROM scripts WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return
+        for table in _TABLES:
+            conn.execute(f'DELETE FROM {table} WHERE script_id = ?', row)
+        conn.execute('DELETE FROM scripts WHERE id = ?', row)
+
+
+def merge_databases(target: Path, sources: Iterable[Path]) -> int:
+    """
+    把其他语料数据库（如各分片的输出）合并到 target，同名脚本以后合并的为准
+
+    Returns:
+        合并的脚本数
+    """
+    conn = sqlite3.connect(target)
+    merged = 0
+    try:
+        conn.executescript(_SCHEMA)
+        for source in sources:
+            conn.execute('ATTACH DATABASE ? AS source', (str(source),))
+            names = [name for (name,) in conn.execute('SELECT name FROM source.scripts')]
+            for name in names:
+                CorpusDatabaseWriter._delete(conn, name)
+            conn.execute('INSERT INTO scripts (name, commands, duration, messages) '
+                         'SELECT name, commands, duration, messages FROM source.scripts')
+            for table in _TABLES:
+                columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')][1:]
+                conn.execute(f"""
+                    INSERT INTO {table} SELECT scripts.id, {', '.join(f'rows.{column}' for column in columns)}
+                    FROM source.{table} AS rows
+                    JOIN source.scripts AS source_scripts ON source_scripts.id = rows.script_id
+                    JOIN scripts ON scripts.name = source_scripts.name
+                """)
+            conn.commit()
+            conn.execute('DETACH DATABASE source')
+            merged += len(names)
+    finally:
+        conn.close()
+    return merged
+
+
+def scripts_using_resource(conn: sqlite3.Connection, name: str) -> List[Tuple[str, int]]:
+    """使用了资源 name 的脚本及使用次数"""
+    return conn.execute('''
+        SELECT scripts.name, COUNT(*) FROM resources
+        JOIN scripts ON scripts.id = resources.script_id
+        WHERE resources.name = ?
+        GROUP BY scripts.id ORDER BY scripts.name
+    ''', (name,)).fetchall()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='查询语料数据库（batch_parser.py --export-mode sqlite 生成）')
+    arg_parser.add_argument('database', type=Path, help='数据库文件')
+    arg_parser.add_argument('--resource', help='列出使用了该资源的脚本')
+    args = arg_parser.parse_args()
+
+    if not args.database.exists():
+        print(f"✗ 未找到数据库: {args.database}")
+        sys.exit(1)
+
+    conn = sqlite3.connect(args.database)
+    try:
+        if args.resource:
+            rows = scripts_using_resource(conn, args.resource)
+            print(f"🔍 {args.resource}: {len(rows)} 个脚本")
+            for name, count in rows:
+                print(f"  {name} ({count} 次)")
+            return
+
+        counts = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                  for table in ('scripts',) + _TABLES}
+        print(f"📦 {args.database}: " + ', '.join(f"{table} {count:,}" for table, count in counts.items()))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
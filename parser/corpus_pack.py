@@ -0,0 +1,355 @@
+"""
+打包语料
+把所有脚本的解析结果写入单个二进制文件（字符串表 + 命令表 + 参数表 + clip表 + 脚本索引），
+读取时内存映射整个文件，按脚本名随机访问
+"""
+
+import argparse
+import json
+import mmap
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from parser import ADVScriptParser, ClipData, Command
+
+
+_MAGIC = b'ADVPACK1'
+_BYTE_ORDER_MARK = 0x01020304  # 按本机字节序写入，读取时用来检查字节序是否一致
+
+# 头部：魔数、字节序标记、字符串/脚本/命令/参数/clip 数量、各段的起始位置
+_HEADER = struct.Struct('=8sIIIIII7Q')
+
+# 各表每行的 uint32 个数
+_SCRIPT_FIELDS = 6   # 脚本名, 第一条命令, 顶层命令数, 命令行结束, 参数行起始, 参数行结束（按脚本名排序）
+_COMMAND_FIELDS = 5  # 命令类型, 原始行, 第一个参数, 参数数, clip行号 + 1（0 表示没有clip）
+_PARAM_FIELDS = 4    # 参数名, 类型, 值（字符串编号或第一条子命令）, 子命令数
+
+_PARAM_STRING = 0
+_PARAM_NESTED = 1
+
+_CLIP_FIELDS = ClipData.__slots__  # clip 表每行9个 double，顺序与 ClipData 字段相同
+
+# clip 附加表每行一个 uint32：低9位标记哪些字段原本是 int；
+# 最高位为1时（clip JSON 异常导致字段不是数值）其余位是字段值JSON在字符串表中的编号
+_CLIP_AS_JSON = 0x80000000
+
+
+def _align(f, boundary: int = 8):
+    """补齐到 boundary 字节，保证每段可以直接 cast 成对应的数组"""
+    padding = -f.tell() % boundary
+    if padding:
+        f.write(b'\0' * padding)
+
+
+class _PackWriter:
+    """在内存中构建各表"""
+
+    def __init__(self):
+        self.string_offsets = array('Q', [0])
+        self.string_data: List[bytes] = []
+        self._string_ids: Dict[str, int] = {}
+        self._string_size = 0
+
+        self.scripts: List[Tuple[str, int, int, int, int, int]] = []
+        self.commands = array('I')
+        self.params = array('I')
+        self.clips = array('d')
+        self.clip_aux = array('I')
+
+    def string(self, value: str, dedupe: bool = True) -> int:
+        """写入字符串并返回编号（原始行几乎不会重复，不参与去重）"""
+        if dedupe:
+            string_id = self._string_ids.get(value)
+            if string_id is not None:
+                return string_id
+        data = value.encode('utf-8')
+        string_id = len(self.string_data)
+        self.string_data.append(data)
+        self._string_size += len(data)
+        self.string_offsets.append(self._string_size)
+        if dedupe:
+            self._string_ids[value] = string_id
+        return string_id
+
+    def _reserve(self, count: int) -> int:
+        first = len(self.commands) // _COMMAND_FIELDS
+        self.commands.extend([0] * (count * _COMMAND_FIELDS))
+        return first
+
+    def add_script(self, name: str, commands: List[Command]):
+        """
+        写入一个脚本：顶层命令占连续的行，嵌套的子命令各自占一段连续的行，
+        整个脚本的命令行和参数行都连续，读取时可以整段取出
+        """
+        first_param = len(self.params) // _PARAM_FIELDS
+        first = self._reserve(len(commands))
+
+        pending = [(first, commands)]
+        while pending:
+            row, block = pending.pop()
+            for offset, command in enumerate(block):
+                pending.extend(self._fill_command(row + offset, command))
+
+        self.scripts.append((name, first, len(commands), len(self.commands) // _COMMAND_FIELDS,
+                             first_param, len(self.params) // _PARAM_FIELDS))
+
+    def _fill_command(self, row: int, command: Command) -> List[Tuple[int, List[Command]]]:
+        nested = []
+        first_param = len(self.params) // _PARAM_FIELDS
+        for key, value in command.params.items():
+            if isinstance(value, list):
+                child_row = self._reserve(len(value))
+                nested.append((child_row, value))
+                self.params.extend((self.string(key), _PARAM_NESTED, child_row, len(value)))
+            else:
+                self.params.extend((self.string(key), _PARAM_STRING, self.string(value), 0))
+
+        clip = command.clip
+        clip_ref = 0
+        if clip is not None:
+            values = [getattr(clip, field) for field in _CLIP_FIELDS]
+            if all(type(value) in (int, float) for value in values):
+                self.clips.extend(map(float, values))
+                self.clip_aux.append(sum(1 << i for i, value in enumerate(values) if type(value) is int))
+            else:
+                self.clips.extend([float('nan')] * len(_CLIP_FIELDS))
+                self.clip_aux.append(_CLIP_AS_JSON | self.string(json.dumps(values, ensure_ascii=False)))
+            clip_ref = len(self.clip_aux)
+
+        base = row * _COMMAND_FIELDS
+        self.commands[base:base + _COMMAND_FIELDS] = array('I', (
+            self.string(command.command_type), self.string(command.raw_line, dedupe=False),
+            first_param, len(self.params) // _PARAM_FIELDS - first_param, clip_ref,
+        ))
+        return nested
+
+    def write(self, output_path: Path):
+        # 脚本索引按名字排序，读取时二分查找
+        script_table = array('I')
+        for name, *rows in sorted(self.scripts):
+            script_table.extend((self.string(name), *rows))
+
+        with open(output_path, 'wb') as f:
+            f.write(b'\0' * _HEADER.size)
+            offsets = []
+            sections = (self.string_offsets, None, script_table, self.commands, self.params,
+                        self.clips, self.clip_aux)
+            for section in sections:
+                _align(f)
+                offsets.append(f.tell())
+                if section is None:
+                    for data in self.string_data:
+                        f.write(data)
+                else:
+                    section.tofile(f)
+
+            f.seek(0)
+            f.write(_HEADER.pack(
+                _MAGIC, _BYTE_ORDER_MARK, len(self.string_data), len(self.scripts),
+                len(self.commands) // _COMMAND_FIELDS, len(self.params) // _PARAM_FIELDS,
+                len(self.clip_aux), *offsets,
+            ))
+
+
+def pack_corpus(output_path: Path, scripts: Iterable[Tuple[str, List[Command]]]) -> int:
+    """
+    把解析结果打包为单个文件
+
+    Args:
+        scripts: (脚本名, 命令列表) 序列，脚本名不能重复
+    Returns:
+        打包的脚本数
+    """
+    writer = _PackWriter()
+    names = set()
+    for name, commands in scripts:
+        if name in names:
+            raise ValueError(f"脚本名重复: {name}")
+        names.add(name)
+        writer.add_script(name, commands)
+    writer.write(output_path)
+    return len(names)
+
+
+def pack_directory(resource_dir: Path, output_path: Path, parser: Optional[ADVScriptParser] = None) -> int:
+    """解析目录下所有 .txt 脚本并打包（脚本名为文件名去掉扩展名）"""
+    parser = parser or ADVScriptParser()
+
+    def scripts():
+        for file_path in sorted(Path(resource_dir).glob('*.txt')):
+            yield file_path.stem, list(parser.parse_file(file_path))
+
+    return pack_corpus(output_path, scripts())
+
+
+class PackedCorpus:
+    """
+    打包语料的只读视图
+
+    打开时只映射文件并校验头部，读取某个脚本时才构建对应的命令，字符串按需解码，
+    原始行在首次访问时才从映射中解码。命令会引用映射的文件，close 之后仍然可以使用，
+    全部释放后才解除映射。
+    clips 为整个语料的 clip 表（n x 9 的 double 视图，列顺序与 ClipData 字段相同，
+    clip JSON 异常导致字段不是数值时该行为 NaN；整个语料没有clip时为空视图）。
+    """
+
+    def __init__(self, path: Path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+
+        (magic, byte_order, n_strings, n_scripts, n_commands, n_params, n_clips,
+         *offsets) = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError(f"不是打包语料文件: {path}")
+        if byte_order != _BYTE_ORDER_MARK:
+            raise ValueError("打包语料的字节序与本机不同")
+
+        strings_at, data_at, scripts_at, commands_at, params_at, clips_at, clip_aux_at = offsets
+        self._data_at = data_at
+        self._string_offsets = view[strings_at:strings_at + (n_strings + 1) * 8].cast('Q')
+        self._scripts = view[scripts_at:scripts_at + n_scripts * _SCRIPT_FIELDS * 4].cast('I')
+        self._commands = view[commands_at:commands_at + n_commands * _COMMAND_FIELDS * 4].cast('I')
+        self._params = view[params_at:params_at + n_params * _PARAM_FIELDS * 4].cast('I')
+        self._clips = view[clips_at:clips_at + n_clips * len(_CLIP_FIELDS) * 8].cast('d')
+        # 零行的多维视图无法 cast，没有clip时 clips 为空的一维视图
+        self.clips = self._clips.cast('B').cast('d', shape=[n_clips, len(_CLIP_FIELDS)]) if n_clips else self._clips
+        self._clip_aux = view[clip_aux_at:clip_aux_at + n_clips * 4].cast('I')
+        self._strings: Dict[int, str] = {}
+        self._names: Optional[List[str]] = None
+
+    def __enter__(self) -> 'PackedCorpus':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """释放各表的视图（之后不能再读取脚本）"""
+        for name in ('clips', '_clips', '_clip_aux', '_string_offsets', '_scripts', '_commands', '_params'):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+
+    def _string(self, string_id: int) -> str:
+        value = self._strings.get(string_id)
+        if value is None:
+            start = self._data_at + self._string_offsets[string_id]
+            end = self._data_at + self._string_offsets[string_id + 1]
+            value = self._strings[string_id] = self._map[start:end].decode('utf-8')
+        return value
+
+    def __len__(self) -> int:
+        return len(self._scripts) // _SCRIPT_FIELDS
+
+    def names(self) -> List[str]:
+        """所有脚本名（已排序）"""
+        if self._names is None:
+            self._names = [self._string(self._scripts[i * _SCRIPT_FIELDS]) for i in range(len(self))]
+        return self._names
+
+    def _find(self, name: str) -> int:
+        """二分查找脚本所在的行，不存在时返回 -1"""
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._string(self._scripts[middle * _SCRIPT_FIELDS]) < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self._string(self._scripts[low * _SCRIPT_FIELDS]) == name:
+            return low
+        return -1
+
+    def __contains__(self, name: str) -> bool:
+        return self._find(name) != -1
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names())
+
+    def __getitem__(self, name: str) -> List[Command]:
+        """读取一个脚本的命令"""
+        row = self._find(name)
+        if row == -1:
+            raise KeyError(name)
+        base = row * _SCRIPT_FIELDS
+        _, first, count, row_end, param_start, param_end = self._scripts[base:base + _SCRIPT_FIELDS]
+
+        # 整个脚本的命令行和参数行一次性取出
+        rows = self._commands[first * _COMMAND_FIELDS:row_end * _COMMAND_FIELDS].tolist()
+        params = self._params[param_start * _PARAM_FIELDS:param_end * _PARAM_FIELDS].tolist()
+
+        def build(index: int) -> Command:
+            base = (index - first) * _COMMAND_FIELDS
+            command_type, raw_line, first_param, param_count, clip_ref = rows[base:base + _COMMAND_FIELDS]
+
+            command_params = {}
+            base = (first_param - param_start) * _PARAM_FIELDS
+            for offset in range(base, base + param_count * _PARAM_FIELDS, _PARAM_FIELDS):
+                key, kind, value, child_count = params[offset:offset + _PARAM_FIELDS]
+                if kind == _PARAM_NESTED:
+                    command_params[self._string(key)] = [build(child) for child in range(value, value + child_count)]
+                else:
+                    command_params[self._string(key)] = self._string(value)
+
+            start = self._data_at + self._string_offsets[raw_line]
+            end = self._data_at + self._string_offsets[raw_line + 1]
+            command = Command.from_source(self._string(command_type), command_params, self._map, start, end)
+            if clip_ref:
+                command.clip = self._clip(clip_ref - 1)
+            return command
+
+        return [build(index) for index in range(first, first + count)]
+
+    def _clip(self, index: int) -> ClipData:
+        aux = self._clip_aux[index]
+        if aux & _CLIP_AS_JSON:
+            return ClipData(*json.loads(self._string(aux & ~_CLIP_AS_JSON)))
+        base = index * len(_CLIP_FIELDS)
+        values = self._clips[base:base + len(_CLIP_FIELDS)].tolist()
+        if aux:
+            values = [int(value) if aux >> i & 1 else value for i, value in enumerate(values)]
+        return ClipData(*values)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='打包/读取ADV脚本语料')
+    subparsers = arg_parser.add_subparsers(dest='action', required=True)
+
+    pack = subparsers.add_parser('pack', help='解析目录下的所有脚本并打包')
+    pack.add_argument('resource_dir', type=Path, help='脚本目录')
+    pack.add_argument('output', type=Path, help='输出文件')
+
+    info = subparsers.add_parser('info', help='查看打包语料')
+    info.add_argument('pack_file', type=Path, help='打包语料文件')
+    info.add_argument('name', nargs='?', help='要读取的脚本名')
+
+    args = arg_parser.parse_args()
+
+    if args.action == 'pack':
+        start = time.perf_counter()
+        count = pack_directory(args.resource_dir, args.output)
+        elapsed = time.perf_counter() - start
+        size = args.output.stat().st_size / 1024 / 1024
+        print(f"✓ 已打包 {count} 个脚本: {args.output} ({size:.2f} MB, {elapsed:.1f} 秒)")
+        return
+
+    start = time.perf_counter()
+    with PackedCorpus(args.pack_file) as corpus:
+        print(f"📦 {args.pack_file}: {len(corpus)} 个脚本, {len(corpus.clips)} 个clip "
+              f"(打开耗时 {(time.perf_counter() - start) * 1000:.2f} 毫秒)")
+        if args.name:
+            if args.name not in corpus:
+                print(f"✗ 未找到脚本: {args.name}")
+                sys.exit(1)
+            start = time.perf_counter()
+            commands = corpus[args.name]
+            print(f"✓ {args.name}: {len(commands)} 条命令 (读取耗时 {(time.perf_counter() - start) * 1000:.2f} 毫秒)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,676 @@
+"""
+随机化等价性检查
+用随机生成的脚本比较不同实现的解析结果，修改扫描器、参数解析等内部实现后运行：
+    python equivalence_check.py [CHECK ...] [--iterations N] [--seed S]
+发现不一致时打印输入和第一处差异，并以非零状态退出
+"""
+
+import argparse
+import codecs
+import contextlib
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import parser as parser_module
+from corpus_pack import PackedCorpus, pack_corpus
+from incremental import IncrementalDocument
+from parser import NESTED_COMMAND_KEYS, ADVScriptParser, ClipData, Command
+from parse_cache import ParseCache
+from script_watcher import ScriptWatcher
+from synthetic import ScriptShape, generate_script
+from timeline import IntervalIndex
+
+
+# 随机脚本的组成片段：语法字符、转义、多字节字符，以及常见的命令和参数片段
+_FRAGMENTS = (
+    '[', ']', '\\', '{', '}', ' ', '=', '"', '\n', '\r\n', '\t', 'a', 'é', 'あ', '　',
+    'x=', ' k=', ' clip=', ' text=', '\\{', '\\}', '\\[', '\\]', '\\"', '\\n',
+    '[message text=', ' name=麻央', '[voice actorId=amao', '[actormotion id=hski',
+    'clip=\\{"_startTime":1.5,"_duration":2.0\\}', 'clip={"_startTime":0.5,"_duration":1}',
+    ' setting=\\{"a":\\{"b":[1,2]\\}\\}', ' layouts=[actorlayout id=a transform=\\{"x":1\\}]',
+    ' actors=[actor id=b][actor id=c]',
+)
+
+
+def random_script(rng: random.Random) -> str:
+    """随机脚本：片段随机拼接，或在合成脚本中随机插入片段"""
+    if rng.random() < 0.5:
+        return ''.join(rng.choice(_FRAGMENTS) for _ in range(rng.randint(0, 60)))
+
+    text = generate_script(ScriptShape(commands=rng.randint(1, 12), message_length=rng.randint(0, 40),
+                                       json_depth=rng.randint(1, 3), escaped_brackets=rng.randint(0, 3),
+                                       seed=rng.randrange(2 ** 32)))
+    for _ in range(rng.randint(0, 3)):
+        pos = rng.randint(0, len(text))
+        text = text[:pos] + rng.choice(_FRAGMENTS) + text[pos:]
+    return text
+
+
+def _clip_key(clip: Optional[ClipData]) -> Optional[tuple]:
+    return tuple(getattr(clip, field) for field in ClipData.__slots__) if clip is not None else None
+
+
+def command_key(command: Command) -> tuple:
+    """用于比较的命令内容（嵌套命令递归展开，clip 会被解码）"""
+    params = [(key, [command_key(child) for child in value] if isinstance(value, list) else value)
+              for key, value in command.params.items()]
+    return command.command_type, params, _clip_key(command.clip), command.raw_line
+
+
+def _outcome(parse: Callable[[], List[Any]]) -> Any:
+    """解析结果，抛出异常时为异常类型（比较时只看类型）"""
+    try:
+        return parse()
+    except Exception as e:
+        return 'exception', type(e).__name__
+
+
+def _first_difference(expected: Any, actual: Any) -> str:
+    if isinstance(expected, list) and isinstance(actual, list):
+        for index, (left, right) in enumerate(zip(expected, actual)):
+            if left != right:
+                return f"第 {index} 条命令\n  期望: {left!r}\n  实际: {right!r}"
+        return f"命令数不同: 期望 {len(expected)}，实际 {len(actual)}"
+    return f"\n  期望: {expected!r}\n  实际: {actual!r}"
+
+
+def _mismatch(text: str, expected: Any, actual: Any) -> str:
+    preview = text if len(text) <= 300 else text[:300] + '…'
+    return f"输入 {preview!r}\n{_first_difference(expected, actual)}"
+
+
+# ---------------------------------------------------------------------------
+# legacy：跳跃扫描器和单遍参数解析与旧实现（逐字符扫描 + 逐个参数提取）一致
+# ---------------------------------------------------------------------------
+
+def _legacy_extract_structured_value(text: str, start: int) -> Tuple[str, int]:
+    """旧实现的 _extract_structured_value"""
+    if start >= len(text):
+        return "", 0
+
+    if text[start:start + 2] == '\\{' or text[start:start + 2] == '\\[':
+        open_char = text[start + 1]
+        close_char = '}' if open_char == '{' else ']'
+        depth = 0
+        i = start
+        result = []
+        while i < len(text):
+            if i + 1 < len(text) and text[i] == '\\':
+                next_char = text[i + 1]
+                if next_char in '{}[]':
+                    result.append(next_char)
+                    if next_char == open_char:
+                        depth += 1
+                    elif next_char == close_char:
+                        depth -= 1
+                        if depth == 0:
+                            return ''.join(result), i + 2 - start
+                    i += 2
+                elif next_char == '"':
+                    result.append('"')
+                    i += 2
+                elif next_char in 'rn':
+                    result.append('\\')
+                    result.append(next_char)
+                    i += 2
+                else:
+                    result.append(text[i])
+                    result.append(next_char)
+                    i += 2
+            else:
+                char = text[i]
+                result.append(char)
+                if char == open_char:
+                    depth += 1
+                elif char == close_char:
+                    depth -= 1
+                    if depth == 0:
+                        return ''.join(result), i + 1 - start
+                i += 1
+        return ''.join(result), len(text) - start
+
+    elif text[start] in '{[':
+        open_char = text[start]
+        close_char = '}' if open_char == '{' else ']'
+        depth = 0
+        i = start
+        while i < len(text):
+            if text[i] == '\\':
+                i += 2
+                continue
+            elif text[i] == open_char:
+                depth += 1
+            elif text[i] == close_char:
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1], i + 1 - start
+            i += 1
+        return text[start:], len(text) - start
+
+    return "", 0
+
+
+def legacy_parse_params(params_str: str) -> Dict[str, Any]:
+    """旧实现的 _parse_params"""
+    params = {}
+    param_positions = []
+    first_match = re.match(r'^(\w+)=', params_str)
+    if first_match:
+        param_positions.append((0, first_match.group(1)))
+    for match in re.finditer(r'\s+(\w+)=', params_str):
+        param_positions.append((match.start() + 1, match.group(1)))
+    if not param_positions:
+        return params
+
+    for idx, (pos, key) in enumerate(param_positions):
+        equal_pos = params_str.index('=', pos) + 1
+        value_start = equal_pos
+        while value_start < len(params_str) and params_str[value_start].isspace():
+            value_start += 1
+
+        is_structured = False
+        if value_start < len(params_str):
+            if params_str[value_start:value_start + 2] in ('\\{', '\\['):
+                is_structured = True
+            elif params_str[value_start] in ('{', '['):
+                is_structured = True
+
+        if is_structured:
+            value, _ = _legacy_extract_structured_value(params_str[value_start:], 0)
+            params[key] = value
+        else:
+            if idx < len(param_positions) - 1:
+                end_pos = param_positions[idx + 1][0]
+                while end_pos > equal_pos and params_str[end_pos - 1].isspace():
+                    end_pos -= 1
+                value_str = params_str[equal_pos:end_pos]
+            else:
+                value_str = params_str[equal_pos:].strip()
+            params[key] = value_str
+    return params
+
+
+def legacy_parse(content: str) -> List[tuple]:
+    """旧实现 parse_file 的扫描循环，返回 command_key 格式的命令"""
+    commands = []
+    i = 0
+    while i < len(content):
+        if content[i] != '[':
+            i += 1
+            continue
+        start_pos = i
+        i += 1
+        command_start = i
+        while i < len(content) and content[i] not in ' \t\n\r]':
+            i += 1
+        command_type = content[command_start:i]
+        while i < len(content) and content[i] in ' \t\n\r':
+            i += 1
+
+        params_start = i
+        depth = 1
+        escape_next = False
+        while i < len(content) and depth > 0:
+            if escape_next:
+                escape_next = False
+                i += 1
+                continue
+            char = content[i]
+            if char == '\\':
+                escape_next = True
+            elif char == '[':
+                depth += 1
+            elif char == ']':
+                depth -= 1
+                if depth == 0:
+                    params = legacy_parse_params(content[params_start:i].strip())
+                    clip = ClipData.from_json_str(params.pop('clip')) if 'clip' in params else None
+                    commands.append((command_type, list(params.items()), _clip_key(clip),
+                                     content[start_pos:i + 1]))
+                    break
+            i += 1
+    return commands
+
+
+def _has_nested(params: List[tuple]) -> bool:
+    return any(key in NESTED_COMMAND_KEYS for key, _ in params)
+
+
+def _without_nested(commands: Any) -> Any:
+    """
+    嵌套命令列表现在解析为子命令（其中的 id= 等不再算作外层参数），与旧实现的结果本来就不同，
+    带有这类参数的命令只比较类型和原始行
+    """
+    if not isinstance(commands, list):
+        return commands
+    return [(key[0], key[3]) if _has_nested(key[1]) else key for key in commands]
+
+
+def check_legacy(rng: random.Random, work_dir: Path) -> Optional[str]:
+    text = random_script(rng)
+    path = work_dir / 'legacy.txt'
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+
+    def read_text() -> str:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    expected = _without_nested(_outcome(lambda: legacy_parse(read_text())))
+    actual = _without_nested(_outcome(lambda: [command_key(cmd) for cmd in ADVScriptParser().parse_file(path)]))
+    if expected != actual:
+        return _mismatch(text, expected, actual)
+
+    # 单独比较参数解析
+    params_str = text.replace('\r\n', '\n').strip()
+    expected = _outcome(lambda: list(legacy_parse_params(params_str).items()))
+    actual = _outcome(lambda: list(ADVScriptParser()._parse_params(params_str).items()))
+    if isinstance(expected, list) and isinstance(actual, list) and (_has_nested(expected) or _has_nested(actual)):
+        return None
+    if expected != actual:
+        return _mismatch(params_str, expected, actual)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# bytes：字节 / mmap、紧凑、缓存和流式解析与文本模式一致
+# ---------------------------------------------------------------------------
+
+def _encode_script(text: str, rng: random.Random) -> Tuple[bytes, bool]:
+    """随机选择编码（UTF-8、带BOM的UTF-8 / UTF-16），返回 (文件内容, 是否为UTF-8)"""
+    choice = rng.random()
+    if choice < 0.1:
+        return codecs.BOM_UTF16_LE + text.encode('utf-16-le'), False
+    if choice < 0.25:
+        return codecs.BOM_UTF8 + text.encode('utf-8'), True
+    return text.encode('utf-8'), True
+
+
+def check_bytes(rng: random.Random, work_dir: Path) -> Optional[str]:
+    text = random_script(rng)
+    data, is_utf8 = _encode_script(text, rng)
+    path = work_dir / 'bytes.txt'
+    path.write_bytes(data)
+
+    def parse(**options) -> Callable[[], List[tuple]]:
+        return lambda: [command_key(cmd) for cmd in ADVScriptParser(**options).parse_file(path)]
+
+    if is_utf8:
+        expected = _outcome(parse())
+    else:
+        # 文本模式只支持UTF-8，UTF-16 以解码后的文本为准
+        normalized = text.replace('\r\n', '\n').replace('\r', '\n')
+        expected = _outcome(lambda: [command_key(cmd) for cmd in ADVScriptParser().iter_commands(normalized)])
+
+    # 只有字节模式嗅探BOM，其他方式与文本模式一样只支持UTF-8
+    variants = {
+        'mmap': parse(use_mmap=True),
+        'bytes': lambda: [command_key(cmd) for cmd in ADVScriptParser().iter_commands(data)],
+    }
+    if is_utf8:
+        cache = ParseCache(work_dir / 'cache')
+        variants['data'] = lambda: [command_key(cmd) for cmd in ADVScriptParser().parse_file(path, data)]
+        variants['compact'] = parse(compact=True)
+        variants['cache'] = parse(cache=cache)
+        variants['cache hit'] = parse(cache=cache)
+    if is_utf8 and not data.startswith(codecs.BOM_UTF8):
+        chunk_size = rng.randint(1, 64)
+        variants['stream'] = lambda: [command_key(cmd)
+                                      for cmd in ADVScriptParser().iter_commands(path, chunk_size=chunk_size)]
+
+    for name, variant in variants.items():
+        actual = _outcome(variant)
+        if actual != expected:
+            return f"[{name}] " + _mismatch(text, expected, actual)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# compact：紧凑模式的字节偏移量换算正确，且整个文件只编码一遍
+# ---------------------------------------------------------------------------
+
+def check_compact(rng: random.Random, work_dir: Path) -> Optional[str]:
+    text = random_script(rng)
+
+    # 任意顺序（包括回退）的换算结果与直接编码前缀一致
+    to_byte = parser_module._Utf8Offsets(text)
+    for _ in range(20):
+        index = rng.randint(0, len(text))
+        expected = len(text[:index].encode('utf-8'))
+        actual = to_byte(index)
+        if actual != expected:
+            return _mismatch(text, f"字符偏移 {index} -> {expected}", f"字符偏移 {index} -> {actual}")
+
+    # 解析时偏移量递增：累计移动的字符数不超过文本长度（回退到开头重新编码时会远超）
+    moved = []
+
+    class CountingOffsets(parser_module._Utf8Offsets):
+        def __call__(self, index: int) -> int:
+            if not self._is_ascii:
+                moved.append(abs(index - self._char_pos))
+            return super().__call__(index)
+
+    path = work_dir / 'compact.txt'
+    path.write_text(text, encoding='utf-8')
+    parser_module._Utf8Offsets = CountingOffsets
+    try:
+        actual = _outcome(lambda: [command_key(cmd) for cmd in ADVScriptParser(compact=True).parse_file(path)])
+    finally:
+        parser_module._Utf8Offsets = CountingOffsets.__base__
+    if sum(moved) > len(text):
+        return _mismatch(text, f"最多移动 {len(text)} 个字符", f"移动了 {sum(moved)} 个字符")
+    expected = _outcome(lambda: [command_key(cmd) for cmd in ADVScriptParser().parse_file(path)])
+    if actual != expected:
+        return _mismatch(text, expected, actual)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# timeline：区间树的查询与逐条扫描一致
+# ---------------------------------------------------------------------------
+
+def _random_time(rng: random.Random) -> float:
+    # 取值集中在少数几个点上，端点重合和零时长的区间经常出现
+    return rng.choice((rng.randint(-2, 20) / 2, rng.uniform(-1, 10)))
+
+
+def check_timeline(rng: random.Random, work_dir: Path) -> Optional[str]:
+    intervals = []
+    for row in range(rng.randint(0, 60)):
+        start = _random_time(rng)
+        intervals.append((start, start + rng.choice((0.0, abs(_random_time(rng)))), row))
+    index = IntervalIndex(intervals)
+
+    for _ in range(20):
+        start = _random_time(rng)
+        end = start + rng.choice((0.0, abs(_random_time(rng))))
+        expected = [row for low, high, row in intervals if low <= end and high >= start]
+        actual = sorted(index.overlapping(start, end))
+        if actual != expected:
+            return f"区间 {intervals!r}\n查询 [{start}, {end}]\n  期望: {expected}\n  实际: {actual}"
+
+    # 解析器上的时刻查询（命令顺序、clip 的开始和时长）
+    parser = ADVScriptParser()
+    path = work_dir / 'timeline.txt'
+    path.write_text(generate_script(ScriptShape(commands=rng.randint(1, 40), seed=rng.randrange(2 ** 32))),
+                    encoding='utf-8')
+    commands = parser.parse_file(path)
+    for _ in range(10):
+        time = rng.uniform(-1, 60)
+        expected = [cmd for cmd in commands
+                    if cmd.has_clip and cmd.clip.startTime <= time <= cmd.clip.startTime + cmd.clip.duration]
+        actual = parser.get_active_commands(time)
+        if actual != expected:
+            return f"{path.name} 时刻 {time}: 期望 {len(expected)} 条命令，实际 {len(actual)} 条"
+    return None
+
+
+# ---------------------------------------------------------------------------
+# index：直接修改 parser.commands 之后，分桶索引、摘要和时间轴视图与新建的解析器一致
+# ---------------------------------------------------------------------------
+
+def _parser_state(parser: ADVScriptParser, types: List[str], times: List[float]) -> tuple:
+    """按类型取出的命令、摘要和各时刻生效的命令（命令以 id 比较）"""
+    return ({command_type: [id(cmd) for cmd in parser.get_commands_by_type(command_type)] for command_type in types},
+            parser.get_timeline_summary(),
+            [[id(cmd) for cmd in parser.get_active_commands(time)] for time in times])
+
+
+def _reference_summary(commands: List[Command]) -> Dict[str, Any]:
+    """逐条统计的时间轴摘要（与 get_timeline_summary 的结果比较）"""
+    if not commands:
+        return {}
+    ends = [cmd.clip.startTime + cmd.clip.duration for cmd in commands if cmd.has_clip]
+    if not ends:
+        return {"total_commands": len(commands), "duration": 0}
+    return {"total_commands": len(commands), "duration": max(ends),
+            "command_types": dict(Counter(cmd.command_type for cmd in commands)), "has_timeline": True}
+
+
+def _mutate_commands(parser: ADVScriptParser, pool: List[Command], rng: random.Random) -> str:
+    """随机修改 parser.commands，返回操作说明"""
+    commands = parser.commands
+    operation = rng.choice(('replace', 'setitem', 'slice', 'delitem', 'insert', 'pop', 'append',
+                            'extend', 'sort', 'reverse', 'remove'))
+    if operation == 'replace':
+        parser.commands = rng.sample(pool, min(len(pool), len(commands)))
+    elif operation == 'setitem' and commands:
+        commands[rng.randrange(len(commands))] = rng.choice(pool)
+    elif operation == 'slice':
+        start = rng.randint(0, len(commands))
+        commands[start:start + rng.randint(0, 3)] = rng.sample(pool, rng.randint(0, min(3, len(pool))))
+    elif operation == 'delitem' and commands:
+        del commands[rng.randrange(len(commands))]
+    elif operation == 'insert':
+        commands.insert(rng.randint(0, len(commands)), rng.choice(pool))
+    elif operation == 'pop' and commands:
+        commands.pop(rng.randrange(len(commands)))
+        commands.append(rng.choice(pool))
+    elif operation == 'append':
+        commands.append(rng.choice(pool))
+    elif operation == 'extend':
+        commands.extend(rng.sample(pool, rng.randint(0, min(3, len(pool)))))
+    elif operation == 'sort':
+        commands.sort(key=lambda cmd: cmd.command_type)
+    elif operation == 'reverse':
+        commands.reverse()
+    elif operation == 'remove' and commands:
+        commands.remove(rng.choice(commands))
+    return operation
+
+
+def check_index(rng: random.Random, work_dir: Path) -> Optional[str]:
+    pool = []
+    for _ in range(2):
+        text = generate_script(ScriptShape(commands=rng.randint(1, 30), seed=rng.randrange(2 ** 32)))
+        pool.extend(ADVScriptParser().iter_commands(text))
+    parser = ADVScriptParser()
+    parser.commands = rng.sample(pool, rng.randint(0, len(pool)))
+    types = sorted({cmd.command_type for cmd in pool})
+    times = [rng.uniform(-1, 30) for _ in range(5)]
+
+    operations = []
+    for _ in range(rng.randint(1, 8)):
+        actual = _parser_state(parser, types, times)
+        fresh = ADVScriptParser()
+        fresh.commands = list(parser.commands)
+        expected = _parser_state(fresh, types, times)
+        if actual != expected:
+            return f"操作 {operations!r} 之后\n  期望: {expected!r}\n  实际: {actual!r}"
+        expected = _reference_summary(parser.commands)
+        actual = parser.get_timeline_summary()
+        if (actual, type(actual.get('duration'))) != (expected, type(expected.get('duration'))):
+            return f"操作 {operations!r} 之后的摘要\n  期望: {expected!r}\n  实际: {actual!r}"
+        operations.append(_mutate_commands(parser, pool, rng))
+    return None
+
+
+# ---------------------------------------------------------------------------
+# incremental：IncrementalDocument 经过随机编辑后与对全文重新解析一致
+# ---------------------------------------------------------------------------
+
+def check_incremental(rng: random.Random, work_dir: Path) -> Optional[str]:
+    text = random_script(rng)
+    document = IncrementalDocument(text)
+    parser = ADVScriptParser()
+    edits = []
+    for _ in range(rng.randint(1, 15)):
+        offset = rng.randint(0, len(text))
+        removed = rng.randint(0, min(len(text) - offset, rng.choice((0, 3, 40))))
+        replacement = ''.join(rng.choice(_FRAGMENTS) for _ in range(rng.randint(0, 4)))
+        edits.append((offset, removed, replacement))
+        text = text[:offset] + replacement + text[offset + removed:]
+        document.apply_edit(offset, removed, replacement)
+
+        if document.text != text:
+            return f"编辑 {edits!r} 之后文本不一致"
+        expected = _outcome(lambda: [command_key(cmd) for cmd in parser.iter_commands(text)])
+        actual = _outcome(lambda: [command_key(cmd) for cmd in document.commands])
+        if actual != expected:
+            return f"编辑 {edits!r}\n" + _mismatch(text, expected, actual)
+        expected_spans = [span[:2] for span in parser._scan_commands(text)]
+        if document.spans != expected_spans:
+            return f"编辑 {edits!r}\n" + _mismatch(text, expected_spans, document.spans)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# pack：打包语料读回的命令与打包前一致（包括整个语料没有clip的情况）
+# ---------------------------------------------------------------------------
+
+def _drop_clips(commands: List[Command]):
+    for command in commands:
+        command.clip = None
+        for value in command.params.values():
+            if isinstance(value, list):
+                _drop_clips(value)
+
+
+def check_pack(rng: random.Random, work_dir: Path) -> Optional[str]:
+    texts = {f"script{index}": random_script(rng) for index in range(rng.randint(0, 4))}
+    without_clips = rng.random() < 0.5
+    scripts: Dict[str, List[Command]] = {}
+    expected: Dict[str, List[tuple]] = {}
+    for name, text in texts.items():
+        # 与 pack_directory 一样从文件解析（换行已统一为 \n）
+        path = work_dir / f"{name}.txt"
+        path.write_text(text, encoding='utf-8')
+        try:
+            commands = ADVScriptParser().parse_file(path)
+            if without_clips:
+                _drop_clips(commands)
+            expected[name] = [command_key(cmd) for cmd in commands]
+        except Exception:  # 无法解析或clip无法解码的脚本不参与打包
+            continue
+        scripts[name] = commands
+
+    path = work_dir / 'corpus.pack'
+    pack_corpus(path, scripts.items())
+
+    def read() -> Dict[str, List[tuple]]:
+        with PackedCorpus(path) as corpus:
+            return {name: [command_key(cmd) for cmd in corpus[name]] for name in corpus}
+
+    actual = _outcome(read)
+    if actual != expected:
+        if isinstance(actual, dict):
+            for name in expected:
+                if actual.get(name) != expected[name]:
+                    return f"[{name}] " + _mismatch(texts[name], expected[name], actual.get(name))
+        return f"脚本 {sorted(texts)!r}{'（去掉clip）' if without_clips else ''}\n  期望: {expected!r}\n  实际: {actual!r}"
+    return None
+
+
+# ---------------------------------------------------------------------------
+# watcher：扫描期间文件被删除时，轮询快照只包含仍然存在的脚本
+# ---------------------------------------------------------------------------
+
+def check_watcher(rng: random.Random, work_dir: Path) -> Optional[str]:
+    directory = work_dir / 'watch'
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir()
+    names = [f"s{index}{rng.choice(('.txt', '.txt', '.json'))}" for index in range(rng.randint(0, 12))]
+    for name in names:
+        (directory / name).write_text('x' * rng.randint(0, 5), encoding='utf-8')
+    if rng.random() < 0.2:
+        (directory / 'folder.txt').mkdir()
+    removed = {name for name in names if rng.random() < 0.4}
+
+    scandir = os.scandir
+
+    @contextlib.contextmanager
+    def scandir_removing(path):
+        # 目录项交给 _snapshot 之前删除对应的文件，模拟 scandir 和 stat 之间文件被删除
+        with scandir(path) as entries:
+            def iterate():
+                for entry in entries:
+                    if entry.name in removed:
+                        os.remove(entry.path)
+                    yield entry
+            yield iterate()
+
+    watcher = ScriptWatcher(directory, use_watchdog=False)
+    os.scandir = scandir_removing
+    try:
+        actual = _outcome(watcher._snapshot)
+    finally:
+        os.scandir = scandir
+    expected = {}
+    for name in names:
+        if name.endswith('.txt') and name not in removed:
+            stat = os.stat(directory / name)
+            expected[name] = (stat.st_size, stat.st_mtime_ns)
+    if actual != expected:
+        return f"文件 {names!r}，扫描期间删除 {sorted(removed)!r}\n  期望: {expected!r}\n  实际: {actual!r}"
+
+    # 目录暂时不存在时轮询跳过这一次扫描
+    shutil.rmtree(directory)
+    actual = _outcome(watcher._try_snapshot)
+    if actual is not None:
+        return f"目录不存在时期望跳过扫描，实际: {actual!r}"
+    return None
+
+
+# 检查名 -> (检查函数, 说明)；检查函数返回差异说明，一致时返回 None
+CHECKS: Dict[str, Tuple[Callable[[random.Random, Path], Optional[str]], str]] = {
+    'legacy': (check_legacy, '扫描器和参数解析 vs 旧实现'),
+    'bytes': (check_bytes, '字节 / mmap / 紧凑 / 缓存 / 流式解析 vs 文本模式'),
+    'compact': (check_compact, '紧凑模式的字节偏移量换算'),
+    'timeline': (check_timeline, '区间树查询 vs 逐条扫描'),
+    'index': (check_index, '修改 parser.commands 后的分桶索引 / 摘要 / 时间轴 vs 新建的解析器和逐条统计'),
+    'incremental': (check_incremental, 'IncrementalDocument 随机编辑 vs 重新解析全文'),
+    'pack': (check_pack, '打包语料读回 vs 打包前的命令'),
+    'watcher': (check_watcher, '扫描期间删除文件时的轮询快照 vs 剩余文件'),
+}
+
+# 每个检查最多打印的不一致数
+MAX_REPORTED = 5
+
+
+def run_check(name: str, iterations: int, seed: int, work_dir: Path) -> int:
+    """运行一个检查，返回不一致的次数（第 i 次使用种子 seed + i，可以用 --seed 单独重现）"""
+    check, description = CHECKS[name]
+    failures = 0
+    for case in range(seed, seed + iterations):
+        message = check(random.Random(f"{name}:{case}"), work_dir)
+        if message is None:
+            continue
+        failures += 1
+        if failures <= MAX_REPORTED:
+            print(f"✗ {name} 种子 {case}（--seed {case} --iterations 1 {name} 重现）: {message}")
+    status = '✓' if not failures else '✗'
+    print(f"{status} {name}（{description}）: {iterations} 次，不一致 {failures} 次")
+    return failures
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='解析器随机化等价性检查')
+    arg_parser.add_argument('checks', nargs='*', metavar='CHECK',
+                            help=f"要运行的检查: {', '.join(CHECKS)}（默认全部）")
+    arg_parser.add_argument('--iterations', type=int, default=2000, help='每个检查的随机用例数')
+    arg_parser.add_argument('--seed', type=int, default=None, help='起始种子（默认随机）')
+    args = arg_parser.parse_args()
+
+    unknown = set(args.checks) - set(CHECKS)
+    if unknown:
+        arg_parser.error(f"未知的检查: {', '.join(sorted(unknown))}")
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    print(f"🎲 起始种子: {seed}")
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in args.checks or list(CHECKS):
+            failures += run_check(name, args.iterations, seed, Path(work_dir))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
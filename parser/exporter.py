@@ -0,0 +1,134 @@
+"""
+流式JSON导出
+逐条写出命令，不在内存中拼出整个文档；支持缩进 / 紧凑 / NDJSON 三种格式。
+也可以先在内存中生成（dump_json），再由单独的写入线程写出（write_output）
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Union
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖
+    orjson = None
+
+
+EXPORT_MODES = ('indent', 'compact', 'ndjson')
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    try:
+        return orjson.dumps(obj)
+    except TypeError:
+        # orjson 不支持的值（如超出64位的整数）改用标准库
+        return _stdlib_dumps(obj)
+
+
+def get_compact_dumps(use_orjson: bool = True) -> Callable[[Any], bytes]:
+    """
+    紧凑序列化函数（返回UTF-8字节），安装了 orjson 时优先使用
+
+    orjson 把 NaN / Infinity 写成 null，标准库写成 NaN / Infinity（与 indent 模式相同）；
+    参数值中含有这类值且需要与 indent 模式一致时应使用 use_orjson=False。
+    """
+    if use_orjson and orjson is not None:
+        return _orjson_dumps
+    return _stdlib_dumps
+
+
+def _indented(obj: Any, level: int) -> str:
+    """与 json.dump(indent=2) 在第 level 层输出的文本一致（JSON字符串中不会出现原始换行符）"""
+    text = json.dumps(obj, ensure_ascii=False, indent=2)
+    return text.replace('\n', '\n' + '  ' * level)
+
+
+def _check_mode(mode: str):
+    if mode not in EXPORT_MODES:
+        raise ValueError(f"未知的导出格式: {mode}（可选: {', '.join(EXPORT_MODES)}）")
+
+
+def _write_parts(write: Callable[[Any], Any], commands: Iterable[Dict[str, Any]], summary: Dict[str, Any],
+                 mode: str, use_orjson: bool):
+    """按顺序把导出内容交给 write：indent 模式为文本片段，其他模式为UTF-8字节片段"""
+    if mode == 'indent':
+        write('{\n  "commands": [')
+        separator = '\n    '
+        for command in commands:
+            write(separator)
+            write(_indented(command, 2))
+            separator = ',\n    '
+        write('\n  ],\n  "summary": ' if separator != '\n    ' else '],\n  "summary": ')
+        write(_indented(summary, 1))
+        write('\n}')
+        return
+
+    dumps = get_compact_dumps(use_orjson)
+    if mode == 'ndjson':
+        write(dumps({"summary": summary}))
+        write(b'\n')
+        for command in commands:
+            write(dumps(command))
+            write(b'\n')
+    else:
+        write(b'{"commands":[')
+        separator = b''
+        for command in commands:
+            write(separator)
+            write(dumps(command))
+            separator = b','
+        write(b'],"summary":')
+        write(dumps(summary))
+        write(b'}')
+
+
+def write_json(output_path: Path, commands: Iterable[Dict[str, Any]], summary: Dict[str, Any],
+               mode: str = 'indent', use_orjson: bool = True):
+    """
+    写出解析结果
+
+    Args:
+        commands: 命令字典（逐条生成即可）
+        summary: 时间轴摘要
+        mode: indent  与 json.dump(indent=2) 逐字节一致的缩进格式
+              compact 无缩进的单行JSON，结构与 indent 相同
+              ndjson  第一行为 {"summary": ...}，之后每行一条命令
+        use_orjson: compact / ndjson 模式下是否使用 orjson（indent 模式始终用标准库以保持输出不变；
+                    NaN / Infinity 的差别见 get_compact_dumps）
+    """
+    _check_mode(mode)
+    if mode == 'indent':
+        # 文本模式写出，换行符与 json.dump 写文件时相同
+        with open(output_path, 'w', encoding='utf-8') as f:
+            _write_parts(f.write, commands, summary, mode, use_orjson)
+        return
+    with open(output_path, 'wb') as f:
+        _write_parts(f.write, commands, summary, mode, use_orjson)
+
+
+def dump_json(commands: Iterable[Dict[str, Any]], summary: Dict[str, Any], mode: str = 'indent',
+              use_orjson: bool = True) -> Union[str, bytes]:
+    """
+    在内存中生成与 write_json 相同的导出内容，交给 write_output 写出（序列化与磁盘写入可以放在不同线程）
+
+    Returns:
+        indent 模式为文本，其他模式为UTF-8字节
+    """
+    _check_mode(mode)
+    parts: List[Any] = []
+    _write_parts(parts.append, commands, summary, mode, use_orjson)
+    return ''.join(parts) if mode == 'indent' else b''.join(parts)
+
+
+def write_output(output_path: Path, payload: Union[str, bytes]):
+    """写出 dump_json 的结果（文本按文本模式写出，与 write_json 的输出一致）"""
+    if isinstance(payload, str):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+    else:
+        with open(output_path, 'wb') as f:
+            f.write(payload)
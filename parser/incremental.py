@@ -0,0 +1,164 @@
+"""
+增量解析
+编辑器每次修改脚本后只重新扫描受影响的命令，其余命令和位置信息原样保留
+"""
+
+from typing import List, Optional, Tuple
+
+from parser import ADVScriptParser, Command
+
+
+class IncrementalDocument:
+    """
+    可增量更新的脚本文档
+
+    commands 与对同一文本调用 parse_file 的结果一致，spans 记录每条命令在文本中的 (起始, 结束)。
+    扫描器在命令结束位置不携带任何状态，所以编辑后从编辑位置之前最后一条完整命令的结尾开始重新扫描，
+    一旦新扫描到的命令起点与编辑之后某条旧命令的起点（平移后）重合，后面的结果就与之前完全相同。
+
+    文本按命令切成片段保存（每段为命令之前的间隔加命令本身，最后一段为末尾剩余文本），
+    编辑只拼接受影响的片段。编辑之后的命令偏移量采用延迟平移：只记录 "从第 k 条起整体平移 d"，
+    下一次编辑时只需修正两次编辑位置之间的命令，连续在同一处输入时每次编辑的开销与脚本长度无关。
+    """
+
+    def __init__(self, text: str, parser: Optional[ADVScriptParser] = None):
+        self.parser = parser or ADVScriptParser()
+        if self.parser.compact or self.parser.use_mmap:
+            raise ValueError("增量解析只支持默认模式的解析器")
+
+        spans = list(self.parser._scan_commands(text))
+        self.commands: List[Command] = list(self.parser._build_commands(text, spans))
+        self._starts = [span[0] for span in spans]
+        self._ends = [span[1] for span in spans]
+        # 下标 >= _shift_index 的偏移量实际值为保存值加 _shift
+        self._shift_index = len(spans)
+        self._shift = 0
+
+        boundaries = [0] + self._ends + [len(text)]
+        self._segments = [text[boundaries[i]:boundaries[i + 1]] for i in range(len(spans) + 1)]
+        self._length = len(text)
+
+    @property
+    def text(self) -> str:
+        """当前的完整文本（每次访问都会重新拼接）"""
+        return ''.join(self._segments)
+
+    def __len__(self) -> int:
+        return len(self.commands)
+
+    def span(self, index: int) -> Tuple[int, int]:
+        """第 index 条命令在文本中的 (起始, 结束)，结束位置不含"""
+        shift = self._shift if index >= self._shift_index else 0
+        return self._starts[index] + shift, self._ends[index] + shift
+
+    @property
+    def spans(self) -> List[Tuple[int, int]]:
+        """所有命令的位置"""
+        return [self.span(index) for index in range(len(self.commands))]
+
+    def _bisect(self, offsets: List[int], value: int, low: int = 0) -> int:
+        """在延迟平移的偏移量中二分查找第一个实际值 >= value 的下标"""
+        high = len(offsets)
+        shift_index, shift = self._shift_index, self._shift
+        while low < high:
+            middle = (low + high) // 2
+            actual = offsets[middle] + (shift if middle >= shift_index else 0)
+            if actual < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def command_at(self, offset: int) -> Optional[int]:
+        """包含 offset 位置的命令下标（不在任何命令内时返回 None）"""
+        index = self._bisect(self._ends, offset + 1)
+        if index < len(self.commands):
+            start, end = self.span(index)
+            if start <= offset < end:
+                return index
+        return None
+
+    def _move_shift(self, index: int):
+        """把延迟平移的起点移动到 index（只修正两者之间的命令）"""
+        if self._shift and index != self._shift_index:
+            if index > self._shift_index:
+                low, high, delta = self._shift_index, index, self._shift
+            else:
+                low, high, delta = index, self._shift_index, -self._shift
+            for offsets in (self._starts, self._ends):
+                offsets[low:high] = [value + delta for value in offsets[low:high]]
+        self._shift_index = index
+
+    def apply_edit(self, offset: int, removed: int, replacement: str) -> Tuple[int, int, int]:
+        """
+        把 text[offset:offset + removed] 替换为 replacement 并更新命令
+
+        Returns:
+            (第一条变化的命令下标, 删除的旧命令数, 插入的新命令数)
+        """
+        if offset < 0 or removed < 0 or offset + removed > self._length:
+            raise ValueError(f"编辑范围越界: offset={offset}, removed={removed}")
+
+        count = len(self.commands)
+        delta = len(replacement) - removed
+
+        # 第一条可能受影响的命令：结束位置在编辑位置之后；之前的命令与片段都不变
+        first = self._bisect(self._ends, offset + 1)
+        resume = self.span(first - 1)[1] if first else 0
+
+        # 窗口：从 resume 开始、覆盖整个编辑区域的片段，在其中完成替换（坐标相对 resume）
+        last = self._bisect(self._ends, offset + removed + 1)
+        window = ''.join(self._segments[first:last + 1])
+        local = offset - resume
+        window = window[:local] + replacement + window[local + removed:]
+        edit_end = local + len(replacement)
+        next_segment = last + 1
+
+        new_spans = []
+        pos = 0
+        sync = None
+        while sync is None:
+            for span in self.parser._scan_commands(window, pos):
+                if span[0] >= edit_end:
+                    # 编辑区域之后：与某条旧命令的起点重合即可停止
+                    old_start = span[0] + resume - delta
+                    index = self._bisect(self._starts, old_start, first)
+                    if index < count and self.span(index)[0] == old_start:
+                        sync = index
+                        break
+                new_spans.append(span)
+                pos = span[1]
+            else:
+                if next_segment >= len(self._segments):
+                    break
+                # 窗口内没有可以对齐的命令（如新输入了未闭合的 [），成倍扩大窗口后从最后一条完整命令继续
+                grow = max(1, next_segment - first)
+                window += ''.join(self._segments[next_segment:next_segment + grow])
+                next_segment += grow
+
+        # 替换片段：新命令各自成段，对齐的旧命令所在片段用窗口中的间隔重建
+        new_segments = []
+        previous_end = 0
+        for span in new_spans:
+            new_segments.append(window[previous_end:span[1]])
+            previous_end = span[1]
+        if sync is None:
+            new_segments.append(window[previous_end:])
+            self._segments[first:] = new_segments
+            sync = count
+        else:
+            sync_end = self.span(sync)[1] + delta - resume
+            new_segments.append(window[previous_end:sync_end])
+            self._segments[first:sync + 1] = new_segments
+
+        new_commands = list(self.parser._build_commands(window, new_spans))
+
+        self._move_shift(sync)
+        self._shift += delta
+        self.commands[first:sync] = new_commands
+        self._starts[first:sync] = [span[0] + resume for span in new_spans]
+        self._ends[first:sync] = [span[1] + resume for span in new_spans]
+        self._shift_index = first + len(new_spans)
+        self._length += delta
+
+        return first, sync - first, len(new_spans)
@@ -0,0 +1,138 @@
+"""
+解析结果缓存
+以文件内容哈希 + 解析器版本为键，把解析结果以 marshal 二进制格式保存在缓存目录中
+"""
+
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / ".cache" / "parse"
+
+# 缓存文件头，格式变化时修改
+_MAGIC = b'ADVC1\n'
+
+
+class ParseCache:
+    """
+    基于内容哈希的磁盘缓存
+
+    键只与文件内容和解析器版本有关，文件移动或重命名后仍然命中。
+    缓存总大小超过 max_bytes 时按最近使用时间（文件 mtime，命中时刷新）淘汰，
+    一直删到总大小低于上限的 90%，避免之后每次写入都触发淘汰。
+    同一个实例可以在多个线程间共享。
+    """
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes: Optional[int] = None  # 首次写入时才统计
+        self._lock = threading.Lock()
+
+    def key(self, data: bytes, version: Any) -> str:
+        """
+        计算缓存键
+
+        Args:
+            data: 文件原始内容
+            version: 解析器版本（如解析器源码的哈希），解析结果变化时必须随之变化
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        # marshal 格式与Python版本相关
+        digest.update(f"{version}:{marshal.version}:{sys.version_info[0]}.{sys.version_info[1]}\0".encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.bin"
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中或文件损坏时返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if not data.startswith(_MAGIC):
+                raise ValueError("bad cache header")
+            records = marshal.loads(memoryview(data)[len(_MAGIC):])
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, EOFError, ValueError, TypeError):
+            # 损坏的缓存文件直接丢弃
+            self.misses += 1
+            self._discard(path)
+            return None
+
+        try:
+            os.utime(path)  # 刷新最近使用时间
+        except OSError:  # 缓存目录只读等情况下只是无法刷新，缓存本身仍然有效
+            pass
+        self.hits += 1
+        return records
+
+    def put(self, key: str, records: Any):
+        """写入缓存（先写临时文件再替换，并发写入同一个键也不会读到半个文件）"""
+        data = _MAGIC + marshal.dumps(records)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            self._discard(Path(tmp_path))
+            return
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def _scan_size(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.cache_dir)
+                   if entry.name.endswith('.bin'))
+
+    def _evict(self, target_bytes: int):
+        """按 mtime 从旧到新删除缓存文件，直到总大小不超过 target_bytes"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.bin'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            self._discard(Path(path))
+            total -= size
+        self._total_bytes = total
+
+    @staticmethod
+    def _discard(path: Path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def clear(self):
+        """删除所有缓存文件"""
+        if self.cache_dir.exists():
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(('.bin', '.tmp')):
+                    self._discard(Path(entry.path))
+        self._total_bytes = 0
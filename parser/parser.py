@@ -3,16 +3,243 @@ Unity ADV脚本解析器
 解析类似 [command param=value] 格式的脚本文件
 """
 
+import os
 import re
+import hashlib
+import sys
 import json
+import mmap
+import codecs
+from collections.abc import MutableMapping
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple, Union
+from dataclasses import dataclass, astuple
+
+from exporter import dump_json, write_json
+from parse_cache import ParseCache
+from parser_stats import STATS
+from timeline import IntervalIndex, TimelineView
+
+
+# 结构化值中的转义：括号和引号去掉反斜杠，其他转义（如 \r \n）原样保留
+_UNESCAPE_PATTERN = re.compile(r'\\([{}\[\]"])|\\[\s\S]')
+
+
+def _unescape_structured(value: str) -> str:
+    """去除括号和引号的转义反斜杠"""
+    if '\\' not in value:
+        return value
+    return _UNESCAPE_PATTERN.sub(lambda m: m.group(1) or m.group(), value)
+
+
+def _source_version() -> str:
+    """本模块源码的哈希"""
+    with open(__file__, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+
+
+# 值为嵌套命令列表的参数，如 layouts=[actorlayout id=... transform=\{...\}]
+NESTED_COMMAND_KEYS = ('layouts', 'actors', 'backgrounds')
+
+
+def _decode_text(data: bytes) -> str:
+    """解码UTF-8原始字节（换行符与文本模式读取一致，统一为 \\n）"""
+    text = data.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def _source_text(source: Union[str, bytes], start: int, end: int) -> str:
+    """取出源文本中的一段（str 直接切片，UTF-8 字节先解码）"""
+    if isinstance(source, str):
+        return source[start:end]
+    return _decode_text(source[start:end])
+
+
+def _find_escaped_value_end(text: Union[str, bytes], start: int, end: Optional[int] = None) -> int:
+    """找到转义JSON（以 \\{ 或 \\[ 开头）的结束位置（不含），找不到时为 end"""
+    syntax = _TEXT_SYNTAX if isinstance(text, str) else _BYTES_SYNTAX
+    open_char = text[start + 1:start + 2]
+    if open_char == syntax.open_brace:
+        close_char, pattern = syntax.close_brace, syntax.brace_token
+    else:
+        close_char, pattern = syntax.close_bracket, syntax.square_token
+    
+    end = len(text) if end is None else end
+    # 转义与未转义的同类括号都计入深度
+    depth = 0
+    for match in pattern.finditer(text, start, end):
+        char = match.group()[-1:]
+        if char == open_char:
+            depth += 1
+        elif char == close_char:
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    
+    return end
+
+
+def _find_raw_value_end(text: Union[str, bytes], start: int, end: Optional[int] = None) -> int:
+    """找到未转义JSON（以 { 或 [ 开头）的结束位置（不含），找不到时为 end"""
+    syntax = _TEXT_SYNTAX if isinstance(text, str) else _BYTES_SYNTAX
+    open_char = text[start:start + 1]
+    if open_char == syntax.open_brace:
+        close_char, pattern = syntax.close_brace, syntax.brace_token
+    else:
+        close_char, pattern = syntax.close_bracket, syntax.square_token
+    
+    end = len(text) if end is None else end
+    # 转义字符整体跳过，只统计未转义的括号
+    depth = 0
+    for match in pattern.finditer(text, start, end):
+        token = match.group()
+        if token == open_char:
+            depth += 1
+        elif token == close_char:
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    
+    return end
+
+
+# 参数值位置的标志位：需要反转义 / 结束位置尚未确定（只记录了参数区的结尾，访问时再找配对的括号）
+_SPAN_UNESCAPE = 1
+_SPAN_OPEN_END = 2
+
+# 未解码的clip：(源文本中的切片 或 已切出的原文, 标志 _SPAN_*)，已切出的原文不带 _SPAN_OPEN_END
+_ClipSource = Tuple[Union[slice, str], int]
+
+
+def _span_text(source: Union[str, bytes], start: int, end: int, flags: int) -> str:
+    """取出参数值原文（尚未反转义），结束位置未确定时先找到结构化值的结尾"""
+    if flags & _SPAN_OPEN_END:
+        find_end = _find_escaped_value_end if flags & _SPAN_UNESCAPE else _find_raw_value_end
+        end = find_end(source, start, end)
+    return _source_text(source, start, end)
+
+
+def _params_size(spans: Iterable[Tuple[int, int, Any, int, int]]) -> int:
+    """扫描结果中参数部分的总长度（用于统计）"""
+    return sum(span[4] - span[3] for span in spans)
+
+
+class _Syntax:
+    """扫描与参数解析用到的正则和字面量，str 与 bytes 各一套"""
+    
+    def __init__(self, encode):
+        # 命令扫描只关心 [ ] \ 三种字符
+        self.command_type = re.compile(encode(r'[^ \t\n\r\]]*'))
+        self.space = re.compile(encode(r'[ \t\n\r]*'))
+        self.bracket = re.compile(encode(r'[\[\]\\]'))
+        self.open_bracket = encode('[')
+        self.backslash = encode('\\')
+        
+        # 参数名：开头的 key= 或空白之后的 key=
+        self.first_param = re.compile(encode(r'(\w+)='))
+        self.next_param = re.compile(encode(r'\s+(\w+)='))
+        self.space_run = re.compile(encode(r'\s*'))
+        
+        # 结构化值边界：转义对整体匹配，其余只匹配同类括号
+        self.escaped_openers = (encode('\\{'), encode('\\['))
+        self.raw_openers = (encode('{'), encode('['))
+        self.open_brace = encode('{')
+        self.close_brace = encode('}')
+        self.close_bracket = encode(']')
+        self.nested_command_keys = frozenset(encode(key) for key in NESTED_COMMAND_KEYS)
+        self.brace_token = re.compile(encode(r'\\[\s\S]|[{}]'))
+        self.square_token = re.compile(encode(r'\\[\s\S]|[\[\]]'))
+
+
+_TEXT_SYNTAX = _Syntax(str)
+_BYTES_SYNTAX = _Syntax(lambda s: s.encode('ascii'))
+
+# 字节模式下只有纯ASCII的参数段才直接在字节上解析；
+# 含非ASCII字符或 \x1c-\x1f（str 视为空白而 bytes 不视为空白）时先解码再按文本规则解析
+_NEEDS_TEXT_LEX = re.compile(rb'[\x1c-\x1f\x80-\xff]')
+
+# 识别文件开头的BOM；UTF-8以外的编码整体解码后按文本解析
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+class _ValueSpan(int):
+    """
+    参数值在源文本中的位置，打包成一个整数：起始 << 34 | 长度 << 2 | 标志（_SPAN_*）
+    
+    单个整数比 (起始, 结束, 标志) 元组小得多，与短参数值本身的大小相当。
+    """
+    __slots__ = ()
+    
+    def unpack(self) -> Tuple[int, int, int]:
+        start = self >> 34
+        return start, start + ((self >> 2) & 0xFFFFFFFF), self & 3
+
+
+class LazyParams(MutableMapping):
+    """
+    延迟取值的参数字典
+    
+    只记录每个参数值在源文本（str 或 UTF-8 字节）中的位置，首次访问时才切片（解码）并反转义。
+    键的顺序和重复键的覆盖规则与普通 dict 相同。
+    """
+    
+    __slots__ = ('_source', '_items')
+    
+    def __init__(self, source: Union[str, bytes]):
+        self._source = source
+        self._items: Dict[str, Any] = {}  # 参数名 -> 已解码的值 或 _ValueSpan
+    
+    def _set_span(self, key: str, start: int, end: int, flags: int):
+        self._items[key] = _ValueSpan(start << 34 | (end - start) << 2 | flags)
+    
+    def __getitem__(self, key: str) -> Any:
+        value = self._items[key]
+        if type(value) is _ValueSpan:
+            start, end, flags = value.unpack()
+            timed = flags and STATS.enabled
+            if timed:
+                started = STATS.start()
+            value = _span_text(self._source, start, end, flags)
+            if flags & _SPAN_UNESCAPE:
+                value = _unescape_structured(value)
+            if timed:
+                STATS.stop('structured', started, size=len(value))
+            self._items[key] = value
+        return value
+    
+    def __setitem__(self, key: str, value: Any):
+        self._items[key] = value
+    
+    def __delitem__(self, key: str):
+        del self._items[key]
+    
+    def __contains__(self, key: object) -> bool:
+        return key in self._items
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._items)
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def __repr__(self):
+        return repr(dict(self.items()))
 
 
 @dataclass
 class ClipData:
     """时间轴clip数据"""
+    __slots__ = ('startTime', 'duration', 'clipIn', 'easeInDuration', 'easeOutDuration',
+                 'blendInDuration', 'blendOutDuration', 'mixInEaseType', 'timeScale')
+    
     startTime: float
     duration: float
     clipIn: float
@@ -44,18 +271,138 @@ class ClipData:
             return cls(0, 0, 0, 0, 0, -1, -1, 1, 1.0)
 
 
-@dataclass
 class Command:
-    """脚本命令"""
-    command_type: str  # 命令类型，如 message, actormotion 等
-    params: Dict[str, Any]  # 参数字典
-    clip: Optional[ClipData]  # 时间轴数据
-    raw_line: str  # 原始行
+    """脚本命令（clip 在首次访问时才解码）"""
+    
+    __slots__ = ('command_type', 'params', '_raw_line', '_source', '_raw_start', '_raw_end',
+                 '_clip', '_clip_source')
+    
+    def __init__(self, command_type: str, params: Dict[str, Any], clip: Optional[ClipData],
+                 raw_line: str, clip_source: Optional[_ClipSource] = None):
+        self.command_type = command_type  # 命令类型，如 message, actormotion 等
+        self.params = params  # 参数字典
+        self._raw_line = raw_line  # 原始行
+        self._source = None  # 原始行所在的源文本（str，或紧凑/字节模式下的 UTF-8 bytes / mmap）
+        self._raw_start = 0
+        self._raw_end = 0
+        self._clip = clip  # 时间轴数据
+        self._clip_source = clip_source  # 未解码的clip原文 (源文本切片或原文, 标志 _SPAN_*)
+    
+    @classmethod
+    def from_source(cls, command_type: str, params: Dict[str, Any], source: Union[str, bytes], start: int, end: int,
+                    clip_source: Optional[_ClipSource] = None) -> 'Command':
+        """原始行只记录在源文本中的偏移量（UTF-8 源文本为字节偏移量），访问时再切片解码"""
+        command = cls(command_type, params, None, None, clip_source)
+        command._source = source
+        command._raw_start = start
+        command._raw_end = end
+        return command
+    
+    @property
+    def raw_line(self) -> str:
+        """原始行"""
+        if self._raw_line is None:
+            return _source_text(self._source, self._raw_start, self._raw_end)
+        return self._raw_line
+    
+    @raw_line.setter
+    def raw_line(self, value: str):
+        self._raw_line = value
+        self._source = None
+    
+    @property
+    def clip(self) -> Optional[ClipData]:
+        """时间轴数据"""
+        if self._clip_source is not None:
+            timed = STATS.enabled
+            if timed:
+                started = STATS.start()
+            text, flags = self._clip_source
+            if isinstance(text, slice):
+                text = _span_text(self._source, text.start, text.stop, flags)
+            self._clip = ClipData.from_json_str(_unescape_structured(text) if flags & _SPAN_UNESCAPE else text)
+            self._clip_source = None
+            if timed:
+                STATS.stop('clip', started, size=len(text))
+        return self._clip
+    
+    @clip.setter
+    def clip(self, value: Optional[ClipData]):
+        self._clip = value
+        self._clip_source = None
+    
+    @property
+    def has_clip(self) -> bool:
+        """是否带有时间轴数据（不触发解码）"""
+        return self._clip_source is not None or self._clip is not None
+    
+    def __eq__(self, other):
+        if not isinstance(other, Command):
+            return NotImplemented
+        return (self.command_type == other.command_type and self.params == other.params
+                and self.clip == other.clip and self.raw_line == other.raw_line)
     
     def __repr__(self):
         return f"<Command {self.command_type} @ {self.clip.startTime if self.clip else 'N/A'}s>"
 
 
+class _CommandList(list):
+    """
+    解析器的命令列表，记录改动已有命令的次数
+    
+    追加命令不计数（分桶索引只需补齐新命令），替换、删除、插入、排序等会使索引和视图失效的操作
+    使 version 加一，解析器据此判断缓存是否过期。
+    """
+    
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.version = 0
+
+
+def _counting(name: str):
+    method = getattr(list, name)
+    
+    def mutate(self, *args, **kwargs):
+        self.version += 1
+        return method(self, *args, **kwargs)
+    
+    mutate.__name__ = name
+    return mutate
+
+
+for _name in ('__setitem__', '__delitem__', '__imul__', 'insert', 'pop', 'remove', 'clear', 'sort', 'reverse'):
+    setattr(_CommandList, _name, _counting(_name))
+del _name
+
+
+class _Utf8Offsets:
+    """
+    把字符偏移量换算为UTF-8字节偏移量
+    
+    从上一次的位置向前或向后移动，只编码两次调用之间的那段文本，
+    偏移量递增时整体开销与文本长度成线性。
+    """
+    
+    __slots__ = ('_text', '_is_ascii', '_char_pos', '_byte_pos')
+    
+    def __init__(self, text: str):
+        self._text = text
+        self._is_ascii = text.isascii()
+        self._char_pos = 0
+        self._byte_pos = 0
+    
+    def __call__(self, index: int) -> int:
+        if self._is_ascii:
+            return index
+        if index < self._char_pos:
+            # 偏移量回退时从当前位置往回减，只重新编码回退的那一段
+            self._byte_pos -= len(self._text[index:self._char_pos].encode('utf-8'))
+        else:
+            self._byte_pos += len(self._text[self._char_pos:index].encode('utf-8'))
+        self._char_pos = index
+        return self._byte_pos
+
+
 class ADVScriptParser:
     """ADV脚本解析器"""
     
@@ -64,319 +411,730 @@ class ADVScriptParser:
     # COMMAND_PATTERN = re.compile(r'\[([^\s\]]+)(.*?)\]', re.DOTALL)
     PARAM_PATTERN = re.compile(r'(\w+)=((?:[^=\s\[]|(?:\{[^}]*\})|(?:\[[^\]]*\]))+)')
     
-    def __init__(self):
-        self.commands: List[Command] = []
+    # 命令扫描与参数解析用到的正则见 _Syntax（str 与 bytes 各一套）
+    
+    # 紧凑模式下驻留的参数值最大长度
+    _INTERN_VALUE_MAX_LENGTH = 64
+    
+    # 解析结果缓存的版本：源码的哈希，修改解析器后自动失效，不需要手动维护
+    CACHE_VERSION = _source_version()
+    
+    def __init__(self, compact: bool = False, use_mmap: bool = False, cache: Optional[ParseCache] = None):
+        """
+        Args:
+            compact: 紧凑模式，源文本改为保留一份UTF-8字节，参数值直接解析出来并驻留短值。
+                     适合把整个语料的解析结果常驻内存做分析。
+                     默认模式下原始行、参数值（LazyParams）和clip只记录在源文本中的位置，
+                     首次访问时才切片和反转义，源文本会随命令一起保留。
+            use_mmap: 字节模式，parse_file 把文件映射到内存后直接在原始字节上扫描，
+                      纯ASCII命令的参数值在首次访问时才解码（参数为 LazyParams）。
+                      命令会引用映射的文件，全部释放后才解除映射。
+            cache: 解析结果缓存，parse_file 先按文件内容哈希查找缓存，未命中时解析并写入。
+                   只用于默认模式（紧凑/字节模式的结果引用源文本，不适合缓存）。
+        """
+        if cache is not None and (compact or use_mmap):
+            raise ValueError("cache 不能与 compact / use_mmap 同时使用")
+        self.compact = compact
+        self.use_mmap = use_mmap
+        self.cache = cache
+        self.commands = []
         
-    def parse_file(self, file_path: Path) -> List[Command]:
-        """解析单个脚本文件"""
+    @property
+    def commands(self) -> List[Command]:
+        return self._commands
+    
+    @commands.setter
+    def commands(self, commands: Iterable[Command]):
+        """替换命令列表（复制为记录改动的列表），分桶索引和视图随之失效"""
+        self._commands = commands if type(commands) is _CommandList else _CommandList(commands)
+        self._reset_index()
+    
+    def _reset_index(self):
+        """清空按类型分桶的索引、累计统计和缓存的视图"""
+        self._indexed_version = self._commands.version  # 建立索引时命令列表的改动次数
+        self._by_type: Dict[str, List[Command]] = {}  # 命令类型 -> 命令（按首次出现的顺序）
+        self._indexed = 0  # 已计入索引的命令数
+        self._summary: Optional[Dict[str, Any]] = None
+        self._timeline: Optional[TimelineView] = None
+        self._interval_index: Optional[IntervalIndex] = None
+    
+    def _append_commands(self, commands: Iterable[Command]):
+        """追加命令并同步更新分桶索引"""
+        self._sync_index()
+        append = self.commands.append
+        for command in commands:
+            append(command)
+            self._index_command(command)
+        self._summary = None
+    
+    def _index_command(self, command: Command):
+        bucket = self._by_type.get(command.command_type)
+        if bucket is None:
+            bucket = self._by_type[command.command_type] = []
+        bucket.append(command)
+        self._indexed += 1
+    
+    def _sync_index(self):
+        """self.commands 被外部直接修改时更新索引（只追加了命令时补齐，其他改动则重建）"""
+        if self._indexed_version != self._commands.version or self._indexed > len(self._commands):
+            self._reset_index()
+        if self._indexed == len(self._commands):
+            return
+        for command in self._commands[self._indexed:]:
+            self._index_command(command)
+        self._summary = None
+    
+    def parse_file(self, file_path: Path, data: Optional[bytes] = None) -> List[Command]:
+        """
+        解析单个脚本文件
+        
+        Args:
+            data: 已经读取的文件内容（如批量解析时由预读线程读取），给出时不再读取文件
+        """
         self.commands = []
+        timed = STATS.enabled
+        if timed:
+            STATS.begin_file(Path(file_path).name)
         
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except UnicodeDecodeError:
-            # 尝试其他编码
-            with open(file_path, 'r', encoding='utf-8-sig') as f:
-                content = f.read()
-        
-        # 手动查找所有命令（正确处理嵌套括号）
-        i = 0
-        while i < len(content):
-            if content[i] == '[':
-                # 找到命令开始
-                start_pos = i
-                i += 1
-                
-                # 提取命令类型（到第一个空格或]）
-                command_start = i
-                while i < len(content) and content[i] not in ' \t\n\r]':
-                    i += 1
-                command_type = content[command_start:i]
-                
-                # 跳过空白
-                while i < len(content) and content[i] in ' \t\n\r':
-                    i += 1
-                
-                # 提取参数直到找到匹配的]
-                params_start = i
-                depth = 1  # 已经遇到了开头的[
-                escape_next = False
-                
-                while i < len(content) and depth > 0:
-                    if escape_next:
-                        escape_next = False
-                        i += 1
-                        continue
-                    
-                    char = content[i]
-                    if char == '\\':
-                        escape_next = True
-                    elif char == '[':
-                        depth += 1
-                    elif char == ']':
-                        depth -= 1
-                        if depth == 0:
-                            # 找到匹配的结束]
-                            params_str = content[params_start:i].strip()
-                            raw_line = content[start_pos:i+1]
-                            
-                            # 解析参数
-                            params = self._parse_params(params_str)
-                            
-                            # 提取clip数据
-                            clip_data = None
-                            if 'clip' in params:
-                                clip_str = params.pop('clip')
-                                clip_data = ClipData.from_json_str(clip_str)
-                            
-                            command = Command(
-                                command_type=command_type,
-                                params=params,
-                                clip=clip_data,
-                                raw_line=raw_line
-                            )
-                            
-                            self.commands.append(command)
-                            break
-                    i += 1
+        if self.use_mmap:
+            if data is not None:
+                buffer = data
             else:
-                i += 1
+                if timed:
+                    started = STATS.start()
+                buffer = self._map_file(file_path)
+                if timed:
+                    STATS.stop('read', started, size=len(buffer))
+            commands = self._build_commands_from_bytes(buffer)
+            self._append_commands(STATS.collect('params', commands) if timed else commands)
+            return self.commands
+        if self.cache is not None:
+            self._append_commands(self._parse_file_cached(file_path, data))
+            return self.commands
+        
+        if data is not None:
+            content = _decode_text(data)
+        else:
+            if timed:
+                started = STATS.start()
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except UnicodeDecodeError:
+                # 尝试其他编码
+                with open(file_path, 'r', encoding='utf-8-sig') as f:
+                    content = f.read()
+            if timed:
+                STATS.stop('read', started, size=len(content))
         
+        self._append_commands(self._parse_content(content))
         return self.commands
     
-    def _parse_params(self, params_str: str) -> Dict[str, Any]:
-        """解析参数字符串"""
-        params = {}
+    def _parse_content(self, content: str) -> Iterable[Command]:
+        """扫描并构建命令；开启统计时先完整扫描一遍，扫描与参数解析分别计时"""
+        if not STATS.enabled:
+            return self._build_commands(content, self._scan_commands(content))
+        spans = STATS.collect('scan', self._scan_commands(content), len(content))
+        return STATS.collect('params', self._build_commands(content, spans), _params_size(spans))
+    
+    def _parse_file_cached(self, file_path: Path, data: Optional[bytes] = None) -> List[Command]:
+        """通过缓存解析文件"""
+        timed = STATS.enabled
+        if data is None:
+            if timed:
+                started = STATS.start()
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            if timed:
+                STATS.stop('read', started, size=len(data))
+        if timed:
+            started = STATS.start()
+        
+        key = self.cache.key(data, self.CACHE_VERSION)
+        cached = self.cache.get(key)
+        if cached is not None:
+            content, records = cached
+            commands = [self._command_from_record(record, content) for record in records]
+            if timed:
+                STATS.stop('cache', started, len(commands), len(data))
+            return commands
+        if timed:
+            STATS.stop('cache', started, 0)
+        
+        # 与文本模式读取的结果一致（UTF-8，换行符统一为 \n）
+        content = _decode_text(data)
+        spans = self._scan_commands(content)
+        spans = STATS.collect('scan', spans, len(content)) if timed else list(spans)
+        commands = self._build_commands(content, spans)
+        commands = STATS.collect('params', commands, _params_size(spans)) if timed else list(commands)
+        # 源文本只保存一份，顶层命令的原始行和clip原文记录为偏移量
+        records = [self._command_to_record(cmd, content, span[0], span[1]) for cmd, span in zip(commands, spans)]
+        self.cache.put(key, (content, records))
+        return commands
+    
+    @classmethod
+    def _command_to_record(cls, cmd: Command, content: Optional[str] = None, start: int = 0, end: int = 0) -> tuple:
+        """
+        命令转换为可 marshal 的记录（未解码的clip保持原文）
+        
+        给出 content 时原始行记为 (start, end)，clip原文记为它在 content 中的 (起始, 结束, 标志)。
+        """
+        if content is not None and type(cmd.params) is LazyParams and cmd.params._source is content:
+            # 尚未取值的参数同样记为 (起始, 结束, 标志)
+            items = [(key, value.unpack() if type(value) is _ValueSpan else value)
+                     for key, value in cmd.params._items.items()]
+        else:
+            items = cmd.params.items()
+        params = tuple(
+            (key, [cls._command_to_record(child) for child in value] if isinstance(value, list) else value)
+            for key, value in items
+        )
+        if cmd._clip_source is not None:
+            clip = cmd._clip_source  # (原文或源文本切片, 标志)
+            if isinstance(clip[0], slice):
+                if content is not None and cmd._source is content:
+                    clip = (clip[0].start, clip[0].stop, clip[1])
+                else:
+                    clip = (_span_text(cmd._source, clip[0].start, clip[0].stop, clip[1]),
+                            clip[1] & _SPAN_UNESCAPE)
+            elif content is not None:
+                # 原文（反转义之前）一定出现在原始行中
+                clip_text, flags = clip
+                clip_start = content.find(clip_text, start, end)
+                clip = (clip_start, clip_start + len(clip_text), flags)
+        elif cmd._clip is not None:
+            clip = astuple(cmd._clip)
+        else:
+            clip = None
+        raw_line = cmd.raw_line if content is None else (start, end)
+        return cmd.command_type, params, raw_line, clip
+    
+    @classmethod
+    def _command_from_record(cls, record: tuple, content: str = '') -> Command:
+        """从缓存记录还原命令"""
+        command_type, params, raw_line, clip = record
+        if type(raw_line) is tuple:
+            items = params
+            params = LazyParams(content)
+            for key, value in items:
+                if type(value) is tuple:
+                    params._set_span(key, *value)
+                elif isinstance(value, list):
+                    params[key] = [cls._command_from_record(child) for child in value]
+                else:
+                    params[key] = value
+            if clip is not None and len(clip) == 3:
+                clip = (slice(clip[0], clip[1]), clip[2])
+            elif clip is not None and len(clip) != 2:
+                command = Command.from_source(command_type, params, content, raw_line[0], raw_line[1])
+                command._clip = ClipData(*clip)
+                return command
+            return Command.from_source(command_type, params, content, raw_line[0], raw_line[1], clip)
         
-        # 找到所有参数名的位置（必须是空格或开头+参数名+等号的模式）
-        param_positions = []
-        # 第一个参数可能在字符串开头
-        first_match = re.match(r'^(\w+)=', params_str)
-        if first_match:
-            param_positions.append((0, first_match.group(1)))
-        
-        # 后续参数必须在空格之后
-        for match in re.finditer(r'\s+(\w+)=', params_str):
-            # 确保不是在值的内部（比如 clip= 在 text 值里面）
-            param_positions.append((match.start() + 1, match.group(1)))
-        
-        # 如果没有参数，返回空字典
-        if not param_positions:
-            return params
-        
-        # 解析每个参数
-        for idx, (pos, key) in enumerate(param_positions):
-            # 找到等号后的位置
-            equal_pos = params_str.index('=', pos) + 1
+        params = {
+            key: [cls._command_from_record(child) for child in value] if isinstance(value, list) else value
+            for key, value in params
+        }
+        if clip is not None and len(clip) != 2:
+            return Command(command_type, params, ClipData(*clip), raw_line)
+        return Command(command_type, params, None, raw_line, clip)
+    
+    def iter_commands(self, path_or_text: Union[str, bytes, os.PathLike], chunk_size: int = 65536) -> Iterator[Command]:
+        """
+        流式逐条产出命令
+        
+        不修改解析器状态（不会写入 self.commands），同一个实例可以在多个线程间共享。
+        字符串视为脚本文本；bytes 视为文件原始内容（按字节模式解析）；
+        Path 等路径对象视为文件，按块读取，内存占用只与单条命令的长度有关。
+        调用方提前停止迭代时，文件剩余部分不会被读取和解析。
+        """
+        if isinstance(path_or_text, str):
+            yield from self._build_commands(path_or_text, self._scan_commands(path_or_text))
+            return
+        if isinstance(path_or_text, (bytes, bytearray, mmap.mmap)):
+            yield from self._build_commands_from_bytes(path_or_text)
+            return
+        
+        with open(path_or_text, 'r', encoding='utf-8') as f:
+            buffer = ''
+            read_size = chunk_size
+            while True:
+                chunk = f.read(read_size)
+                if not chunk:
+                    break
+                buffer += chunk
+                
+                # 只处理已经完整出现的命令，未闭合的命令留到下一块
+                spans = list(self._scan_commands(buffer))
+                complete_end = spans[-1][1] if spans else 0
+                pending = buffer.find('[', complete_end)
+                cut = len(buffer) if pending == -1 else pending
+                
+                if spans:
+                    yield from self._build_commands(buffer[:cut], spans)
+                buffer = buffer[cut:]
+                # 单条命令跨越多个块时加倍读取，避免反复重扫
+                read_size = chunk_size if cut else read_size * 2
             
-            # 先检查是否是结构化值（JSON对象或数组）
-            value_start = equal_pos
-            while value_start < len(params_str) and params_str[value_start].isspace():
-                value_start += 1
+            # 文件末尾未闭合的命令与 parse_file 一样忽略
+    
+    def _build_commands(self, content: str, spans: Iterable[Tuple[int, int, str, int, int]]) -> Iterator[Command]:
+        """根据扫描得到的位置构建命令"""
+        if self.compact:
+            yield from self._build_compact_commands(content, spans)
+            return
+        
+        # 默认模式：原始行、参数值和clip都只记录在源文本中的位置，访问时才切片（源文本随命令一起保留）
+        intern = sys.intern
+        match_space = _TEXT_SYNTAX.space_run.match
+        for start, end, command_type, params_start, params_end in spans:
+            # 去掉参数两端的空白（只移动位置，不切出参数字符串）
+            params_start = match_space(content, params_start, params_end).end()
+            while params_end > params_start and content[params_end - 1].isspace():
+                params_end -= 1
+            params, clip_source = self._parse_params_lazy(content, params_start, params_end)
+            yield Command.from_source(intern(command_type), params, content, start, end, clip_source)
+    
+    def _build_compact_commands(self, content: str, spans: Iterable[Tuple[int, int, str, int, int]]) -> Iterator[Command]:
+        """紧凑模式：保留一份UTF-8源文本（日文脚本按str保存时每个字符至少占2字节），短参数值驻留"""
+        source = content.encode('utf-8')
+        to_byte = _Utf8Offsets(content)
+        
+        intern = sys.intern
+        for start, end, command_type, params_start, params_end in spans:
+            raw_params = content[params_start:params_end]
+            params_str = raw_params.strip()
             
-            # 如果是结构化值，使用 _extract_structured_value 来确定真实长度
-            is_structured = False
-            if value_start < len(params_str):
-                # 先检查转义的括号（双字符）
-                if params_str[value_start:value_start+2] in ('\\{', '\\['):
-                    is_structured = True
-                # 再检查普通括号（单字符）
-                elif params_str[value_start] in ('{', '['):
-                    is_structured = True
+            # 解析参数（clip 只保留原文位置，首次访问时再解码）
+            params, clip_span = self._parse_params_deferring_clip(params_str)
             
-            if is_structured:
-                value, consumed_length = self._extract_structured_value(params_str[value_start:], 0)
-                params[key] = value
+            # clip 原文同样以源文本中的位置保存
+            # 按 start、clip、end 的顺序换算，偏移量保持递增，整个文件只编码一遍
+            byte_start = to_byte(start)
+            clip_source = None
+            if clip_span is not None:
+                offset = params_start + len(raw_params) - len(raw_params.lstrip())
+                clip_start, clip_end, flags = clip_span
+                clip_source = (slice(to_byte(offset + clip_start), to_byte(offset + clip_end)), flags)
+            yield Command.from_source(intern(command_type), params, source, byte_start, to_byte(end),
+                                      clip_source)
+    
+    def _map_file(self, file_path: Path) -> Union[mmap.mmap, bytes]:
+        """只读映射整个文件（空文件无法映射，返回空字节串）"""
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    def _build_commands_from_bytes(self, buffer: Union[bytes, mmap.mmap]) -> Iterator[Command]:
+        """字节模式：在原始UTF-8字节上扫描命令，参数值尽量推迟到访问时再解码"""
+        # 先嗅探BOM，整个文件只读一次
+        start_pos = 0
+        for bom, encoding in _BOMS:
+            if buffer[:len(bom)] == bom:
+                if encoding != 'utf-8':
+                    content = bytes(buffer[len(bom):]).decode(encoding)
+                    content = content.replace('\r\n', '\n').replace('\r', '\n')
+                    yield from self._build_commands(content, self._scan_commands(content))
+                    return
+                start_pos = len(bom)
+                break
+        
+        intern = sys.intern
+        needs_text_lex = _NEEDS_TEXT_LEX.search
+        spans = self._scan_commands(buffer, start_pos)
+        if STATS.enabled:
+            spans = STATS.collect('scan', spans, len(buffer) - start_pos)
+        for start, end, command_type, params_start, params_end in spans:
+            command_type = intern(_decode_text(command_type))
+            raw_params = buffer[params_start:params_end]
+            clip_source = None
+            
+            if needs_text_lex(raw_params):
+                # 含非ASCII字符（如对话文本）：整段解码后按文本规则解析，参数值仍在访问时才切片
+                params_str = _decode_text(raw_params).strip()
+                params, clip_span = self._parse_params_lazy(params_str, 0, len(params_str))
+                if clip_span is not None:
+                    clip_slice, flags = clip_span
+                    clip_source = (_span_text(params_str, clip_slice.start, clip_slice.stop, flags),
+                                   flags & _SPAN_UNESCAPE)
             else:
-                # 普通值：确定值的结束位置
-                if idx < len(param_positions) - 1:
-                    # 下一个参数之前的位置（不包括前导空格）
-                    next_param_start = param_positions[idx + 1][0]
-                    # 回溯找到非空白字符的位置
-                    end_pos = next_param_start
-                    while end_pos > equal_pos and params_str[end_pos - 1].isspace():
-                        end_pos -= 1
-                    value_str = params_str[equal_pos:end_pos]
+                # 纯ASCII：直接在字节上解析，只记录参数值的位置
+                params_bytes = raw_params.strip()
+                params = LazyParams(params_bytes)
+                for key, value_start, value_end, flags in self._lex_params(params_bytes, defer_end=True):
+                    if key == b'clip':
+                        offset = params_start + len(raw_params) - len(raw_params.lstrip())
+                        clip_source = (slice(offset + value_start, offset + value_end), flags)
+                    elif key in _BYTES_SYNTAX.nested_command_keys and params_bytes.startswith(b'[', value_start):
+                        # 与文本模式一样统一换行符
+                        self._set_nested_commands(params, intern(key.decode('ascii')),
+                                                  _decode_text(params_bytes[value_start:value_end]))
+                    else:
+                        params._set_span(intern(key.decode('ascii')), value_start, value_end, flags)
+            
+            yield Command.from_source(command_type, params, buffer, start, end, clip_source)
+    
+    def _scan_commands(self, content: Union[str, bytes], pos: int = 0) -> Iterator[Tuple[int, int, Any, int, int]]:
+        """
+        扫描所有命令（正确处理嵌套括号和转义）
+        
+        只在 [ ] \\ 三种有意义的字符之间跳跃，其余字符由 find / 正则整段跳过。
+        content 可以是 str，也可以是 UTF-8 的 bytes / mmap（多字节字符不会包含ASCII字节）。
+        产出 (命令起始, 命令结束, 命令类型, 参数起始, 参数结束)，结束位置不含。
+        """
+        syntax = _TEXT_SYNTAX if isinstance(content, str) else _BYTES_SYNTAX
+        open_bracket = syntax.open_bracket
+        backslash = syntax.backslash
+        find = content.find
+        match_type = syntax.command_type.match
+        match_space = syntax.space.match
+        search_bracket = syntax.bracket.search
+        
+        i = find(open_bracket, pos)
+        while i != -1:
+            # 提取命令类型（到第一个空格或]）
+            type_end = match_type(content, i + 1).end()
+            # 跳过空白
+            params_start = match_space(content, type_end).end()
+            
+            # 提取参数直到找到匹配的]
+            depth = 1  # 已经遇到了开头的[
+            pos = params_start
+            while True:
+                match = search_bracket(content, pos)
+                if match is None:
+                    # 命令未闭合，文件剩余部分不会再有完整命令
+                    return
+                pos = match.start()
+                char = match.group()
+                if char == backslash:
+                    pos += 2  # 跳过被转义的字符
+                elif char == open_bracket:
+                    depth += 1
+                    pos += 1
                 else:
-                    value_str = params_str[equal_pos:].strip()
-                
-                params[key] = value_str
+                    depth -= 1
+                    if depth == 0:
+                        break
+                    pos += 1
+            
+            yield i, pos + 1, content[i + 1:type_end], params_start, pos
+            i = find(open_bracket, pos + 1)
+    
+    def _parse_params(self, params_str: str) -> Dict[str, Any]:
+        """解析参数字符串"""
+        params = {}
+        for key, start, end, flags in self._lex_params(params_str):
+            value = params_str[start:end]
+            if flags & _SPAN_UNESCAPE:
+                params[key] = _unescape_structured(value)
+            elif key in NESTED_COMMAND_KEYS and value.startswith('['):
+                self._set_nested_commands(params, key, value)
+            else:
+                params[key] = value
         
         return params
     
+    def _parse_nested_commands(self, value: str) -> List[Command]:
+        """把嵌套命令列表（如 [actorlayout id=amao transform=\\{...\\}]）解析为子命令"""
+        children = []
+        for start, end, command_type, params_start, params_end in self._scan_commands(value):
+            params_str = value[params_start:params_end].strip()
+            params, clip_span = self._parse_params_deferring_clip(params_str)
+            clip_source = None
+            if clip_span is not None:
+                clip_start, clip_end, flags = clip_span
+                clip_source = (params_str[clip_start:clip_end], flags)
+            children.append(Command(sys.intern(command_type), params, None, value[start:end], clip_source))
+        return children
+    
+    def _set_nested_commands(self, params: MutableMapping, key: str, value: str):
+        """设置嵌套命令参数；同名参数重复出现时（如两个 backgrounds=）子命令依次追加"""
+        children = self._parse_nested_commands(value)
+        existing = params.get(key)
+        if isinstance(existing, list):
+            existing.extend(children)
+        else:
+            params[key] = children
+    
+    def _parse_params_lazy(self, text: str, start: int, end: int) -> Tuple[LazyParams, Optional[_ClipSource]]:
+        """
+        解析 text[start:end] 中的参数，参数值只记录在 text 中的位置（LazyParams）
+        
+        结构化值连结束位置都推迟到访问时才查找，只读取少数参数时不必扫描其余的JSON。
+        clip 不放入参数字典，返回其位置 (切片, 标志)；嵌套命令列表直接解析为子命令。
+        """
+        params = LazyParams(text)
+        clip_source = None
+        intern = sys.intern
+        
+        for key, value_start, value_end, flags in self._lex_params(text, start, end, defer_end=True):
+            if key == 'clip':
+                clip_source = (slice(value_start, value_end), flags)
+            elif key in NESTED_COMMAND_KEYS and text.startswith('[', value_start):
+                self._set_nested_commands(params, intern(key), text[value_start:value_end])
+            else:
+                params._set_span(intern(key), value_start, value_end, flags)
+        
+        return params, clip_source
+    
+    def _parse_params_deferring_clip(self, params_str: str) -> Tuple[Dict[str, Any], Optional[Tuple[int, int, int]]]:
+        """解析参数字符串，clip 不放入参数字典，只返回其位置 (起始, 结束, 标志 _SPAN_UNESCAPE 或 0)"""
+        params = {}
+        clip_span = None
+        intern = sys.intern
+        compact = self.compact
+        
+        for key, start, end, flags in self._lex_params(params_str):
+            if key == 'clip':
+                clip_span = (start, end, flags)
+                continue
+            
+            value = params_str[start:end]
+            if flags & _SPAN_UNESCAPE:
+                value = _unescape_structured(value)
+            elif key in NESTED_COMMAND_KEYS and value.startswith('['):
+                self._set_nested_commands(params, intern(key), value)
+                continue
+            elif compact and end - start <= self._INTERN_VALUE_MAX_LENGTH:
+                # 紧凑模式下短值（角色id、资源名等）同样驻留
+                value = intern(value)
+            # 参数名在整个语料中反复出现，驻留后所有命令共享同一个字符串
+            params[intern(key)] = value
+        
+        return params, clip_span
+    
+    def _lex_params(self, params_str: Union[str, bytes], start: int = 0, end: Optional[int] = None,
+                    defer_end: bool = False) -> Iterator[Tuple[Any, int, int, int]]:
+        """
+        单遍扫描参数字符串（str 或纯ASCII的 bytes），只看 params_str[start:end] 这一段
+        
+        产出 (参数名, 值起始, 值结束, 标志 _SPAN_*)，位置均相对于整个 params_str。
+        defer_end 时结构化值（嵌套命令列表除外）不查找配对的括号，值结束记为参数区结尾，
+        并带上 _SPAN_OPEN_END，由 _span_text 在访问时确定结束位置。
+        参数名必须位于开头或空白之后（与旧实现一致：text 值里的 " clip=" 也会被当作参数名）。
+        嵌套命令列表（NESTED_COMMAND_KEYS）内部的参数名除外。
+        """
+        syntax = _TEXT_SYNTAX if isinstance(params_str, str) else _BYTES_SYNTAX
+        escaped_openers = syntax.escaped_openers
+        raw_openers = syntax.raw_openers
+        open_bracket = syntax.open_bracket
+        nested_command_keys = syntax.nested_command_keys
+        end_of_text = len(params_str) if end is None else end
+        match_space = syntax.space_run.match
+        
+        keys = syntax.next_param.finditer(params_str, start, end_of_text)
+        current = syntax.first_param.match(params_str, start, end_of_text) or next(keys, None)
+        
+        while current is not None:
+            following = next(keys, None)
+            key = current.group(1)
+            equal_pos = current.end()
+            value_start = match_space(params_str, equal_pos, end_of_text).end()
+            
+            if params_str.startswith(escaped_openers, value_start, end_of_text):
+                # 转义的JSON，需要反转义
+                if defer_end:
+                    yield key, value_start, end_of_text, _SPAN_UNESCAPE | _SPAN_OPEN_END
+                else:
+                    yield key, value_start, _find_escaped_value_end(params_str, value_start, end_of_text), _SPAN_UNESCAPE
+            elif params_str.startswith(raw_openers, value_start, end_of_text):
+                # 普通的JSON或嵌套命令
+                if key in nested_command_keys and params_str.startswith(open_bracket, value_start):
+                    # 嵌套命令里的 id= 等属于子命令，不是外层的参数
+                    value_end = _find_raw_value_end(params_str, value_start, end_of_text)
+                    while following is not None and following.start() < value_end:
+                        following = next(keys, None)
+                    yield key, value_start, value_end, 0
+                elif defer_end:
+                    yield key, value_start, end_of_text, _SPAN_OPEN_END
+                else:
+                    yield key, value_start, _find_raw_value_end(params_str, value_start, end_of_text), 0
+            elif following is not None:
+                # 普通值：到下一个参数名之前（下一个参数前的空白属于分隔符）
+                yield key, equal_pos, following.start(), 0
+            else:
+                # 最后一个普通值：去掉首尾空白
+                value_end = end_of_text
+                while value_end > value_start and params_str[value_end - 1:value_end].isspace():
+                    value_end -= 1
+                yield key, value_start, value_end, 0
+            
+            current = following
+    
     def _extract_structured_value(self, text: str, start: int) -> tuple[str, int]:
         """提取结构化值（JSON对象或数组）"""
         if start >= len(text):
             return "", 0
         
         # 处理转义的JSON（\{ 和 \}）
-        if text[start:start+2] == '\\{' or text[start:start+2] == '\\[':
-            # 这是转义的JSON，需要去除括号的反斜杠，但保留引号的转义
-            open_char = text[start+1]
-            close_char = '}' if open_char == '{' else ']'
-            depth = 0
-            i = start
-            result = []
-            
-            while i < len(text):
-                if i + 1 < len(text) and text[i] == '\\':
-                    next_char = text[i+1]
-                    if next_char in '{}[]':
-                        # 转义的括号，去掉反斜杠
-                        result.append(next_char)
-                        if next_char == open_char:
-                            depth += 1
-                        elif next_char == close_char:
-                            depth -= 1
-                            if depth == 0:
-                                return ''.join(result), i + 2 - start
-                        i += 2
-                    elif next_char == '"':
-                        # 转义的引号，保留为正常引号（JSON需要）
-                        result.append('"')
-                        i += 2
-                    elif next_char in 'rn':
-                        # \r \n 保留转义
-                        result.append('\\')
-                        result.append(next_char)
-                        i += 2
-                    else:
-                        # 其他转义，保留
-                        result.append(text[i])
-                        result.append(next_char)
-                        i += 2
-                else:
-                    # 未转义的字符（包括未转义的括号）
-                    char = text[i]
-                    result.append(char)
-                    # 未转义的括号也需要计入深度
-                    if char == open_char:
-                        depth += 1
-                    elif char == close_char:
-                        depth -= 1
-                        if depth == 0:
-                            return ''.join(result), i + 1 - start
-                    i += 1
-            
-            return ''.join(result), len(text) - start
+        if text.startswith(('\\{', '\\['), start):
+            end = _find_escaped_value_end(text, start)
+            return _unescape_structured(text[start:end]), end - start
         
         # 普通的JSON（未转义）
         elif text[start] in '{[':
-            open_char = text[start]
-            close_char = '}' if open_char == '{' else ']'
-            depth = 0
-            i = start
-            
-            while i < len(text):
-                if text[i] == '\\':
-                    i += 2  # 跳过转义字符
-                    continue
-                elif text[i] == open_char:
-                    depth += 1
-                elif text[i] == close_char:
-                    depth -= 1
-                    if depth == 0:
-                        return text[start:i+1], i + 1 - start
-                i += 1
-            
-            return text[start:], len(text) - start
+            end = _find_raw_value_end(text, start)
+            return text[start:end], end - start
         
         return "", 0
     
     def get_commands_by_type(self, command_type: str) -> List[Command]:
         """获取特定类型的命令"""
-        return [cmd for cmd in self.commands if cmd.command_type == command_type]
+        self._sync_index()
+        return list(self._by_type.get(command_type, ()))
+    
+    def timeline_view(self) -> TimelineView:
+        """当前命令列表的时间轴列式视图（命令列表不变时复用）"""
+        self._sync_index()
+        if self._timeline is None:
+            self._timeline = TimelineView.from_commands(self.commands)
+            self._interval_index = None
+        elif len(self._timeline) < len(self.commands):
+            # 只追加了命令（其他改动已在 _sync_index 中清空视图）：补齐新命令
+            self._interval_index = None
+            try:
+                for command in self.commands[len(self._timeline):]:
+                    self._timeline.append(command)
+            except BaseException:
+                self._timeline = None  # 追加到一半的视图各列长度不一致，下次重新构建
+                raise
+        return self._timeline
+    
+    def interval_index(self) -> IntervalIndex:
+        """clip 时间区间索引，行号为命令下标（与时间轴视图一起缓存）"""
+        view = self.timeline_view()
+        if self._interval_index is None:
+            self._interval_index = IntervalIndex.from_view(view)
+        return self._interval_index
+    
+    def get_active_commands(self, time: float,
+                            command_types: Optional[Iterable[str]] = None) -> List[Command]:
+        """获取在 time 时刻生效的命令（按脚本顺序）"""
+        return self.get_commands_in_range(time, time, command_types)
+    
+    def get_commands_in_range(self, start: float, end: float,
+                              command_types: Optional[Iterable[str]] = None) -> List[Command]:
+        """获取clip与 [start, end] 有交集的命令（按脚本顺序）"""
+        commands = [self.commands[row] for row in sorted(self.interval_index().overlapping(start, end))]
+        if command_types is not None:
+            command_types = set(command_types)
+            commands = [cmd for cmd in commands if cmd.command_type in command_types]
+        return commands
     
     def get_timeline_summary(self) -> Dict[str, Any]:
-        """获取时间轴摘要"""
+        """获取时间轴摘要（命令列表不变时复用上次的结果）"""
         if not self.commands:
             return {}
         
-        commands_with_time = [cmd for cmd in self.commands if cmd.clip]
-        
-        if not commands_with_time:
-            return {"total_commands": len(self.commands), "duration": 0}
+        self._sync_index()
+        if self._summary is None:
+            self._summary = self._build_summary()
         
-        max_time = max(cmd.clip.startTime + cmd.clip.duration 
-                      for cmd in commands_with_time)
+        summary = dict(self._summary)
+        if "command_types" in summary:
+            summary["command_types"] = dict(summary["command_types"])
+        return summary
+    
+    def _build_summary(self) -> Dict[str, Any]:
+        """在时间轴列式视图上统计（视图随命令追加增量更新）"""
+        try:
+            view = self.timeline_view()
+        except TypeError:
+            # clip 字段不是数值（clip JSON 异常）时无法放入视图，逐条统计
+            return self._build_summary_from_commands()
+        if not view.start:
+            return {"total_commands": len(view), "duration": 0}
         
-        # 统计命令类型
-        type_counts = {}
+        # 最晚结束的clip在列上求出，时长取该命令clip的原始数值（保持原始数值类型）
+        clip = self.commands[view.rows[view.last_ending()]].clip
+        return {
+            "total_commands": len(view),
+            "duration": clip.startTime + clip.duration,
+            "command_types": view.type_counts(),
+            "has_timeline": True
+        }
+    
+    def _build_summary_from_commands(self) -> Dict[str, Any]:
+        max_end = None
         for cmd in self.commands:
-            type_counts[cmd.command_type] = type_counts.get(cmd.command_type, 0) + 1
-        
+            if cmd.has_clip:
+                end = cmd.clip.startTime + cmd.clip.duration
+                if max_end is None or end > max_end:
+                    max_end = end
+        if max_end is None:
+            return {"total_commands": len(self.commands), "duration": 0}
         return {
             "total_commands": len(self.commands),
-            "duration": max_time,
-            "command_types": type_counts,
-            "has_timeline": len(commands_with_time) > 0
+            "duration": max_end,
+            "command_types": {command_type: len(bucket) for command_type, bucket in self._by_type.items()},
+            "has_timeline": True
         }
     
-    def export_to_json(self, output_path: Path):
-        """导出为JSON格式"""
-        data = {
-            "commands": [
-                {
-                    "type": cmd.command_type,
-                    "params": self._clean_params(cmd.params),
-                    "clip": asdict(cmd.clip) if cmd.clip else None
-                }
-                for cmd in self.commands
-            ],
-            "summary": self.get_timeline_summary()
-        }
+    def export_to_json(self, output_path: Path, mode: str = 'indent'):
+        """
+        导出为JSON格式（逐条写出命令）
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        Args:
+            mode: indent（默认，缩进格式）/ compact（单行）/ ndjson（每行一条命令），见 exporter.write_json
+        """
+        timed = STATS.enabled
+        if timed:
+            started = STATS.start()
+        commands = (self._command_to_dict(cmd) for cmd in self.commands)
+        write_json(output_path, commands, self.get_timeline_summary(), mode)
+        if timed:
+            STATS.stop('export', started, size=os.path.getsize(output_path))
+    
+    def dump_json(self, mode: str = 'indent') -> Union[str, bytes]:
+        """在内存中生成 export_to_json 的输出内容，用 exporter.write_output 写出"""
+        timed = STATS.enabled
+        if timed:
+            started = STATS.start()
+        commands = (self._command_to_dict(cmd) for cmd in self.commands)
+        payload = dump_json(commands, self.get_timeline_summary(), mode)
+        if timed:
+            STATS.stop('export', started, size=len(payload))
+        return payload
+    
+    def _command_to_dict(self, cmd: Command) -> Dict[str, Any]:
+        """命令转换为导出用的字典（嵌套命令同样转换）"""
+        clip = cmd.clip
+        if STATS.enabled:
+            started = STATS.start()
+            params = self._clean_params(cmd.params)
+            STATS.stop('clean', started)
+        else:
+            params = self._clean_params(cmd.params)
+        return {
+            "type": cmd.command_type,
+            "params": params,
+            # 与 asdict 结果相同，ClipData 的字段都是数值，不需要递归复制
+            "clip": {field: getattr(clip, field) for field in ClipData.__slots__} if clip else None
+        }
     
     def _clean_params(self, params: Dict[str, Any]) -> Dict[str, Any]:
-        """清理参数：解析JSON字符串，移除重复字段"""
+        """清理参数：解析JSON字符串，嵌套命令转换为字典列表"""
         cleaned = {}
         
-        # 处理包含嵌套命令的参数（如 layouts, actors, backgrounds）
-        nested_command_keys = ['layouts', 'actors', 'backgrounds']
-        has_nested = any(k in params for k in nested_command_keys)
-        
         for key, value in params.items():
-            if isinstance(value, str):
+            if isinstance(value, list):
+                # 嵌套命令（如 layouts, actors, backgrounds）
+                cleaned[key] = [self._command_to_dict(child) for child in value]
+                continue
+            
+            if isinstance(value, str) and value.startswith(('{', '[')):
                 # 尝试解析JSON字符串
-                if value.startswith('{'):
-                    try:
-                        parsed = json.loads(value)
-                        cleaned[key] = parsed
-                        continue
-                    except json.JSONDecodeError:
-                        pass
-                elif value.startswith('[') and key not in nested_command_keys:
-                    # 非嵌套命令的数组，尝试解析JSON
-                    try:
-                        parsed = json.loads(value)
-                        cleaned[key] = parsed
-                        continue
-                    except json.JSONDecodeError:
-                        pass
+                try:
+                    cleaned[key] = json.loads(value)
+                    continue
+                except json.JSONDecodeError:
+                    pass
             
             # 保留原值
             cleaned[key] = value
         
-        # 移除嵌套命令导致的重复参数
-        # 例如：actorlayoutgroup的layouts="[actorlayout id=amao transform=\{...\}]"
-        # 解析器错误地把 id 和 transform 也当成了 actorlayoutgroup 的参数
-        if has_nested:
-            # 只保留嵌套命令键
-            nested_key = next((k for k in nested_command_keys if k in cleaned), None)
-            if nested_key and isinstance(cleaned[nested_key], str):
-                # 提取嵌套命令中的参数名
-                nested_content = cleaned[nested_key]
-                # 检测嵌套内容中的参数（如 id=, transform=）
-                import re
-                nested_params = set(re.findall(r'\s+(\w+)=', nested_content))
-                
-                # 移除与嵌套内容重复的参数
-                for param_name in list(cleaned.keys()):
-                    if param_name != nested_key and param_name in nested_params:
-                        del cleaned[param_name]
-        
         return cleaned
     
     def get_messages(self) -> List[Dict[str, Any]]:
@@ -416,6 +1174,11 @@ def main():
     output_file = project_root / f"{current_file.stem}.json"
     parser.export_to_json(output_file)
     print(f"\n✓ 已导出JSON: {output_file}")
+    
+    if STATS.enabled:
+        # ADV_PARSER_STATS=1 时输出分阶段统计
+        print()
+        print(STATS.format_report())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,164 @@
+"""
+解析器分阶段统计
+按阶段记录耗时、调用次数和处理的数据量（逐文件 + 汇总），用于在真实语料上找出热点。
+默认关闭，关闭时各处只多一次属性判断；设置环境变量 ADV_PARSER_STATS=1 或使用 --stats 开启。
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List
+
+
+# 阶段名 -> 说明（按一次解析 + 导出的先后顺序）
+PHASES = {
+    'read': '读取文件',
+    'cache': '缓存还原',
+    'scan': '命令扫描',
+    'params': '参数解析',
+    'structured': '结构化值',
+    'clip': 'clip解码',
+    'clean': '参数清理',
+    'export': '导出JSON',
+}
+
+
+class PhaseStats:
+    """单个阶段的累计值"""
+
+    __slots__ = ('calls', 'seconds', 'self_seconds', 'size')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0  # 含嵌套阶段的耗时
+        self.self_seconds = 0.0  # 扣除嵌套阶段后的耗时，各阶段相加即为总耗时
+        self.size = 0  # 处理的数据量（读取按字节，文本阶段按字符）
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'calls': self.calls, 'seconds': self.seconds, 'self_seconds': self.self_seconds, 'size': self.size}
+
+
+class ParserStats:
+    """
+    分阶段统计
+
+    阶段可以嵌套（如导出时的参数清理会触发结构化值和clip的解码），
+    嵌套阶段的耗时同时计入外层阶段的 seconds，但不计入外层的 self_seconds。
+    逐文件的统计归属于当前线程最近一次 begin_file 的文件，解析之后的导出也算在同一个文件上。
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.totals: Dict[str, PhaseStats] = {}
+        self.files: Dict[str, Dict[str, PhaseStats]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.totals = {}
+            self.files = {}
+
+    def begin_file(self, name: str):
+        """之后当前线程记录的统计都归属于 name"""
+        self._local.file = name
+
+    def start(self) -> float:
+        """开始计时一个阶段，返回值交给 stop"""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)  # 嵌套阶段的累计耗时
+        return time.perf_counter()
+
+    def stop(self, phase: str, started: float, calls: int = 1, size: int = 0):
+        """结束 start 开始的阶段并记录"""
+        elapsed = time.perf_counter() - started
+        stack = self._local.stack
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        self.record(phase, elapsed, elapsed - nested, calls, size)
+
+    def record(self, phase: str, seconds: float, self_seconds: float, calls: int = 1, size: int = 0):
+        name = getattr(self._local, 'file', None)
+        with self._lock:
+            targets = [self.totals]
+            if name is not None:
+                targets.append(self.files.setdefault(name, {}))
+            for phases in targets:
+                stats = phases.get(phase)
+                if stats is None:
+                    stats = phases[phase] = PhaseStats()
+                stats.calls += calls
+                stats.seconds += seconds
+                stats.self_seconds += self_seconds
+                stats.size += size
+
+    def collect(self, phase: str, items: Iterable[Any], size: int = 0) -> List[Any]:
+        """把生成器一次取完并计为一个阶段，调用次数为产出的条数"""
+        started = self.start()
+        items = list(items)
+        self.stop(phase, started, len(items), size)
+        return items
+
+    def merge(self, data: Dict[str, Any]):
+        """合并另一个进程 to_dict() 的结果（进程池模式下汇总各工作进程的统计）"""
+        with self._lock:
+            pairs = [(self.totals, data.get('totals', {}))]
+            pairs += [(self.files.setdefault(name, {}), phases) for name, phases in data.get('files', {}).items()]
+            for target, phases in pairs:
+                for phase, values in phases.items():
+                    stats = target.get(phase)
+                    if stats is None:
+                        stats = target[phase] = PhaseStats()
+                    stats.calls += values['calls']
+                    stats.seconds += values['seconds']
+                    stats.self_seconds += values['self_seconds']
+                    stats.size += values['size']
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'totals': {phase: stats.to_dict() for phase, stats in self.totals.items()},
+                'files': {name: {phase: stats.to_dict() for phase, stats in phases.items()}
+                          for name, phases in self.files.items()},
+            }
+
+    def format_report(self, top: int = 10) -> str:
+        """可读的汇总表和最耗时的文件"""
+        with self._lock:
+            totals = dict(self.totals)
+            file_times = sorted(((sum(stats.self_seconds for stats in phases.values()), name)
+                                 for name, phases in self.files.items()), reverse=True)
+
+        overall = sum(stats.self_seconds for stats in totals.values()) or 1.0
+        lines = ["分阶段耗时（自身耗时 / 占比 / 含嵌套阶段的耗时）:"]
+        for phase, label in PHASES.items():
+            stats = totals.get(phase)
+            if stats is None:
+                continue
+            lines.append(f"  {phase:<10} {label:<6} {stats.calls:>10,} 次 {stats.self_seconds * 1000:>10.1f} ms "
+                         f"{stats.self_seconds / overall:>6.1%}  (含嵌套 {stats.seconds * 1000:.1f} ms)"
+                         f"  数据量 {stats.size:,}")
+
+        if file_times and top:
+            lines.append(f"\n最耗时的 {min(top, len(file_times))} 个文件:")
+            for seconds, name in file_times[:top]:
+                lines.append(f"  {seconds * 1000:10.1f} ms  {name}")
+        return '\n'.join(lines)
+
+
+def _enabled_by_env() -> bool:
+    return os.environ.get('ADV_PARSER_STATS', '').strip().lower() not in ('', '0', 'false', 'no', 'off')
+
+
+# 进程内共享的统计对象，解析器各阶段都记录到这里
+STATS = ParserStats(enabled=_enabled_by_env())
+
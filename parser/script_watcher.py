@@ -0,0 +1,132 @@
+"""
+脚本目录监视
+安装了 watchdog 时使用系统的文件变化通知（Linux 上为 inotify），否则定时扫描目录比较大小和修改时间；
+一连串的变化（如 git pull）合并为一次，等目录安静下来后再通知
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog 是可选依赖
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    """watchdog 事件中只关心指定后缀的文件"""
+
+    def __init__(self, suffix: str, changed: threading.Event):
+        self.suffix = suffix
+        self.changed = changed
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        paths = (event.src_path, getattr(event, 'dest_path', '') or '')
+        if any(str(path).endswith(self.suffix) for path in paths):
+            self.changed.set()
+
+
+class ScriptWatcher:
+    """
+    监视目录下的脚本文件（不含子目录）
+
+    用法:
+        with ScriptWatcher(resource_dir) as watcher:
+            while True:
+                watcher.wait_for_changes()
+                ...
+    """
+
+    def __init__(self, directory: Path, suffix: str = '.txt', poll_interval: float = 0.25,
+                 use_watchdog: bool = True):
+        self.directory = Path(directory)
+        self.suffix = suffix
+        self.poll_interval = poll_interval
+        self.use_watchdog = use_watchdog and Observer is not None
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+        self._observer = None
+        self._poller: Optional[threading.Thread] = None
+
+    @property
+    def mode(self) -> str:
+        return 'watchdog' if self.use_watchdog else 'polling'
+
+    def start(self) -> 'ScriptWatcher':
+        if self.use_watchdog:
+            self._observer = Observer()
+            self._observer.schedule(_ChangeHandler(self.suffix, self._changed), str(self.directory), recursive=False)
+            self._observer.start()
+        else:
+            self._poller = threading.Thread(target=self._poll, name='script-watcher', daemon=True)
+            self._poller.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._changed.set()  # 唤醒正在等待的 wait_for_changes
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if self._poller is not None:
+            self._poller.join()
+
+    def __enter__(self) -> 'ScriptWatcher':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith(self.suffix) and entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:  # 扫描期间被删除或重命名的文件跳过
+                    continue
+        return snapshot
+
+    def _try_snapshot(self) -> Optional[Dict[str, Tuple[int, int]]]:
+        """目录暂时不存在或无法读取时返回 None，轮询线程下次再扫描"""
+        try:
+            return self._snapshot()
+        except OSError:
+            return None
+
+    def _poll(self):
+        previous = self._try_snapshot() or {}
+        while not self._stopped.wait(self.poll_interval):
+            current = self._try_snapshot()
+            if current is not None and current != previous:
+                previous = current
+                self._changed.set()
+
+    def wait_for_changes(self, debounce: float = 0.2, max_delay: float = 1.0,
+                         timeout: Optional[float] = None) -> bool:
+        """
+        等待一批变化
+
+        第一次变化之后，直到 debounce 秒内没有新的变化才返回；
+        持续不断的变化最多推迟 max_delay 秒，避免一直等待。
+
+        Returns:
+            是否有变化（超时或已停止时返回 False）
+        """
+        if not self._changed.wait(timeout) or self._stopped.is_set():
+            return False
+        first = time.monotonic()
+        while True:
+            self._changed.clear()
+            remaining = max_delay - (time.monotonic() - first)
+            if remaining <= 0 or not self._changed.wait(min(debounce, remaining)):
+                return not self._stopped.is_set()
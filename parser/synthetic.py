@@ -0,0 +1,123 @@
+"""
+合成ADV脚本生成器
+按命令数、对话长度、JSON嵌套深度、转义括号数量等维度生成可控规模的脚本，用于基准测试
+"""
+
+import random
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+
+_CLIP_TEMPLATE = ('\\{{"_startTime":{start},"_duration":{duration},"_easeInDuration":0.0,"_easeOutDuration":0.0,'
+                  '"_blendInDuration":-1.0,"_blendOutDuration":-1.0,"_mixInEaseType":1,"_mixOutEaseType":1,'
+                  '"_timeScale":1.0\\}}')
+
+_ACTORS = ('amao', 'hski', 'ttmr', 'fktn', 'kllj', 'ssmk', 'hrnm', 'shro')
+_NAMES = ('麻央', '咲季', '手毬', 'ことね', 'リーリヤ', '清夏', '広', 'プロデューサー')
+_TEXT = 'いつもありがとう、プロデューサー。今日のレッスンも頑張りましょうね！'
+
+
+@dataclass(frozen=True)
+class ScriptShape:
+    """合成脚本的规模参数"""
+
+    commands: int = 1000  # 命令数
+    message_length: int = 40  # 每条 message 的对话文本长度（字符）
+    json_depth: int = 3  # camerasetting / transform 中 \{...\} 的嵌套深度
+    escaped_brackets: int = 0  # 每条 message 文本中额外的转义括号对（\[ \] / \{ \}）
+    seed: int = 0
+
+
+# 各维度单独放大时使用的取值，其余维度保持 ScriptShape 的默认值
+AXES: Dict[str, List[int]] = {
+    'commands': [1_000, 4_000, 16_000],
+    'message_length': [40, 1_000, 10_000],
+    'json_depth': [3, 16, 64],
+    'escaped_brackets': [0, 50, 500],
+}
+
+
+def _clip(start: float, duration: float) -> str:
+    return _CLIP_TEMPLATE.format(start=round(start, 4), duration=round(duration, 4))
+
+
+def _nested_json(depth: int, rng: random.Random) -> str:
+    """深度为 depth 的转义JSON对象，形如 transform 的 position/rotation/scale"""
+    value = (f'\\{{"x":{rng.uniform(-2, 2):.6f},"y":{rng.uniform(0, 2):.6f},'
+             f'"z":{rng.uniform(-2, 2):.6f}\\}}')
+    for level in range(depth - 1):
+        value = f'\\{{"level{level}":{value},"scale":\\{{"x":1.0,"y":1.0,"z":1.0\\}},"active":true\\}}'
+    return value
+
+
+def _message_text(length: int, escaped_brackets: int, rng: random.Random) -> str:
+    text = (_TEXT * (length // len(_TEXT) + 1))[:length]
+    if escaped_brackets:
+        # 在文本中均匀插入转义括号（如 <r\=...> 注音和 \[ \] 引用）
+        pieces = [text[i * length // escaped_brackets:(i + 1) * length // escaped_brackets]
+                  for i in range(escaped_brackets)]
+        text = ''.join(piece + rng.choice(('\\[', '\\{')) + rng.choice(('\\]', '\\}')) for piece in pieces)
+    return text.replace('。', '。\\r\\n')
+
+
+def iter_commands(shape: ScriptShape) -> Iterator[str]:
+    """逐行生成命令"""
+    rng = random.Random(shape.seed)
+    actors = _ACTORS[:4]
+    time = 0.0
+
+    actor_list = ' '.join(f'actors=[actor id={actor} body=mdl_chr_{actor}-casl-0000_body '
+                          f'face=mdl_chr_{actor}-base-0000_face]' for actor in actors)
+    header = [
+        '[backgroundgroup backgrounds=[background id=room src=env_3d_adv_classroom-00-00-noon]]',
+        f'[actorgroup {actor_list}]',
+    ]
+    for line in header[:shape.commands]:
+        yield line
+
+    for index in range(len(header), shape.commands):
+        kind = rng.random()
+        actor = rng.choice(actors)
+        if kind < 0.3:
+            duration = rng.uniform(1.0, 5.0)
+            text = _message_text(shape.message_length, shape.escaped_brackets, rng)
+            yield f'[message text={text} name={rng.choice(_NAMES)} clip={_clip(time, duration)}]'
+            time += duration
+        elif kind < 0.5:
+            yield (f'[actormotion id={actor} motion=mot_all_chr_cmmn_talk-{rng.randrange(100):03d}_pose '
+                   f'clip={_clip(time, rng.uniform(0.03, 3.0))}]')
+        elif kind < 0.65:
+            yield (f'[actorfacialmotion id={actor} motion=mot_all_chr_{actor}_facial-all-default_in '
+                   f'transition=0 clip={_clip(time, 0.0333333351)}]')
+        elif kind < 0.8:
+            yield (f'[voice voice=vo_adv_{actor}_{index:05d} actorId={actor} '
+                   f'clip={_clip(time, rng.uniform(0.5, 4.0))}]')
+        elif kind < 0.92:
+            transform = _nested_json(shape.json_depth, rng)
+            yield (f'[camerasetting setting=\\{{"focalLength":30.0,"transform":{transform},'
+                   f'"dofSetting":\\{{"active":false,"focalPoint":4.0\\}}\\}} clip={_clip(time, 0.0)}]')
+        else:
+            layouts = ' '.join(f'layouts=[actorlayout id={name} transform={_nested_json(shape.json_depth, rng)}]'
+                               for name in actors[:2])
+            yield f'[actorlayoutgroup {layouts} clip={_clip(time, 0.0)}]'
+
+
+def generate_script(shape: ScriptShape = ScriptShape()) -> str:
+    """生成一份合成脚本（同一个 shape 总是生成相同的文本）"""
+    return '\n'.join(iter_commands(shape)) + '\n'
+
+
+def write_script(path: Path, shape: ScriptShape = ScriptShape()) -> Path:
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in iter_commands(shape):
+            f.write(line)
+            f.write('\n')
+    return Path(path)
+
+
+def axis_shapes(base: ScriptShape = ScriptShape()) -> Iterator[Tuple[str, int, ScriptShape]]:
+    """(维度, 取值, 规模参数)：每个维度单独放大，其余维度保持 base"""
+    for axis, values in AXES.items():
+        for value in values:
+            yield axis, value, replace(base, **{axis: value})
@@ -0,0 +1,302 @@
+"""
+时间轴列式视图
+把命令列表中的时间轴数据按列（struct of arrays）保存，用于快速统计
+"""
+
+from array import array
+from collections import Counter
+from operator import add
+from typing import Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy 是可选依赖
+    np = None
+
+
+def get_actor_id(command) -> Optional[str]:
+    """命令关联的角色id（voice 用 actorId，actor* 命令用 id）"""
+    params = command.params
+    actor_id = params.get('actorId')
+    if actor_id is None and command.command_type.startswith('actor'):
+        actor_id = params.get('id')
+    return actor_id
+
+
+class TimelineView:
+    """
+    时间轴的列式视图
+
+    command_types 覆盖所有命令；start / duration / type_code / actor / rows
+    只包含带clip的命令，按命令顺序排列，rows 为其在命令列表中的下标。
+    类型和角色以整数编码保存，编码按首次出现的顺序分配。
+    """
+
+    def __init__(self):
+        self.type_names: List[str] = []  # 类型编码 -> 命令类型
+        self.actor_names: List[str] = []  # 角色编码 -> 角色id
+        self.command_types = array('H')  # 所有命令的类型编码
+
+        self.rows = array('I')
+        self.start = array('d')
+        self.duration = array('d')
+        self.type_code = array('H')
+        self.actor = array('i')  # -1 表示没有关联角色
+
+        self._type_index: Dict[str, int] = {}
+        self._actor_index: Dict[str, int] = {}
+
+    @classmethod
+    def from_commands(cls, commands: Iterable) -> 'TimelineView':
+        """从命令列表构建视图"""
+        view = cls()
+        for command in commands:
+            view.append(command)
+        return view
+
+    @classmethod
+    def merge(cls, views: Iterable['TimelineView']) -> 'TimelineView':
+        """合并多个视图（如整个语料），编码重新分配"""
+        merged = cls()
+        row_offset = 0
+        for view in views:
+            type_map = [merged._type_code(name) for name in view.type_names]
+            actor_map = [merged._actor_code(name) for name in view.actor_names]
+            actor_map.append(-1)  # 让 -1 映射回 -1
+
+            merged.command_types.extend(array('H', map(type_map.__getitem__, view.command_types)))
+            merged.rows.extend(array('I', (row + row_offset for row in view.rows)))
+            merged.start.extend(view.start)
+            merged.duration.extend(view.duration)
+            merged.type_code.extend(array('H', map(type_map.__getitem__, view.type_code)))
+            merged.actor.extend(array('i', map(actor_map.__getitem__, view.actor)))
+            row_offset += len(view.command_types)
+        return merged
+
+    def _type_code(self, command_type: str) -> int:
+        code = self._type_index.get(command_type)
+        if code is None:
+            code = self._type_index[command_type] = len(self.type_names)
+            self.type_names.append(command_type)
+        return code
+
+    def _actor_code(self, actor_id: Optional[str]) -> int:
+        if actor_id is None:
+            return -1
+        code = self._actor_index.get(actor_id)
+        if code is None:
+            code = self._actor_index[actor_id] = len(self.actor_names)
+            self.actor_names.append(actor_id)
+        return code
+
+    def append(self, command):
+        """追加一条命令"""
+        type_code = self._type_code(command.command_type)
+        row = len(self.command_types)
+        self.command_types.append(type_code)
+
+        if not command.has_clip:
+            return
+        clip = command.clip
+        self.rows.append(row)
+        self.start.append(clip.startTime)
+        self.duration.append(clip.duration)
+        self.type_code.append(type_code)
+        self.actor.append(self._actor_code(get_actor_id(command)))
+
+    def __len__(self) -> int:
+        return len(self.command_types)
+
+    @property
+    def end(self) -> array:
+        """每个clip的结束时间"""
+        return array('d', map(add, self.start, self.duration))
+
+    def last_ending(self) -> int:
+        """结束时间最晚的clip所在的列下标（没有clip时为 -1）"""
+        if not self.start:
+            return -1
+        end = self.end
+        return max(range(len(end)), key=end.__getitem__)
+
+    def total_duration(self) -> float:
+        """总时长（最晚的clip结束时间）"""
+        return max(self.end) if self.start else 0.0
+
+    def type_counts(self, timed_only: bool = False) -> Dict[str, int]:
+        """每种命令的数量（按首次出现的顺序）"""
+        counts = Counter(self.type_code if timed_only else self.command_types)
+        names = self.type_names
+        return {names[code]: count for code, count in counts.items()}
+
+    def _group_intervals(self, codes: Sequence[int]) -> Dict[int, List[tuple]]:
+        """按编码分组并按开始时间排序的 (开始, 结束) 区间"""
+        groups: Dict[int, List[tuple]] = {}
+        for code, start, end in zip(codes, self.start, self.end):
+            groups.setdefault(code, []).append((start, end))
+        for intervals in groups.values():
+            intervals.sort()
+        return groups
+
+    def actor_screen_time(self) -> Dict[str, float]:
+        """每个角色的出场时长（该角色所有clip区间的并集长度）"""
+        screen_time = {}
+        for code, intervals in self._group_intervals(self.actor).items():
+            if code < 0:
+                continue
+            total = 0.0
+            current_start, current_end = intervals[0]
+            for start, end in intervals[1:]:
+                if start > current_end:
+                    total += current_end - current_start
+                    current_start, current_end = start, end
+                elif end > current_end:
+                    current_end = end
+            total += current_end - current_start
+            screen_time[self.actor_names[code]] = total
+        return screen_time
+
+    def overlap_counts(self) -> Dict[str, int]:
+        """每种命令中与同类型更早的clip时间重叠的clip数量"""
+        overlaps = {}
+        for code, intervals in self._group_intervals(self.type_code).items():
+            count = 0
+            latest_end = float('-inf')
+            for start, end in intervals:
+                if start < latest_end:
+                    count += 1
+                latest_end = max(latest_end, end)
+            overlaps[self.type_names[code]] = count
+        return overlaps
+
+    def max_concurrency(self) -> int:
+        """同一时刻最多同时生效的clip数量"""
+        events = sorted([(start, 1) for start in self.start] +
+                        [(end, -1) for end in self.end])
+        active = peak = 0
+        for _, delta in events:
+            active += delta
+            peak = max(peak, active)
+        return peak
+
+    def as_numpy(self) -> Dict[str, 'np.ndarray']:
+        """以 numpy 数组（零拷贝）返回各列，需要安装 numpy"""
+        if np is None:
+            raise ImportError("as_numpy 需要安装 numpy")
+        return {
+            'rows': np.frombuffer(self.rows, dtype=np.uint32),
+            'start': np.frombuffer(self.start, dtype=np.float64),
+            'duration': np.frombuffer(self.duration, dtype=np.float64),
+            'type_code': np.frombuffer(self.type_code, dtype=np.uint16),
+            'actor': np.frombuffer(self.actor, dtype=np.int32),
+        }
+
+
+class _IntervalNode:
+    """中心区间树的节点"""
+
+    __slots__ = ('center', 'by_start', 'by_end', 'left', 'right')
+
+    def __init__(self, center: float, intervals: List[tuple]):
+        self.center = center
+        self.by_start = sorted(intervals)  # 按开始时间升序
+        self.by_end = sorted(intervals, key=lambda item: item[1], reverse=True)  # 按结束时间降序
+        self.left: Optional['_IntervalNode'] = None
+        self.right: Optional['_IntervalNode'] = None
+
+
+class IntervalIndex:
+    """
+    clip 时间区间索引（静态中心区间树）
+
+    区间按闭区间 [开始, 结束] 处理，时长为0的clip在其开始时刻生效。
+    时刻查询与区间查询均为 O(log n + k)，返回命中区间的行号（不保证顺序）。
+    """
+
+    def __init__(self, intervals: Iterable[tuple]):
+        """
+        Args:
+            intervals: (开始, 结束, 行号) 序列
+        """
+        intervals = list(intervals)
+        self.size = len(intervals)
+        self._root = self._build(intervals)
+
+    @classmethod
+    def from_view(cls, view: TimelineView) -> 'IntervalIndex':
+        """以命令下标为行号构建索引"""
+        return cls(zip(view.start, view.end, view.rows))
+
+    @staticmethod
+    def _build(intervals: List[tuple]) -> Optional[_IntervalNode]:
+        if not intervals:
+            return None
+
+        # 用栈代替递归，避免极端数据下的递归深度问题
+        endpoints = sorted(value for start, end, _ in intervals for value in (start, end))
+        root = None
+        stack = [(intervals, endpoints, None, False)]
+        while stack:
+            items, points, parent, is_right = stack.pop()
+            center = points[len(points) // 2]
+
+            left, here, right = [], [], []
+            for item in items:
+                if item[1] < center:
+                    left.append(item)
+                elif item[0] > center:
+                    right.append(item)
+                else:
+                    here.append(item)
+
+            node = _IntervalNode(center, here)
+            if parent is None:
+                root = node
+            elif is_right:
+                parent.right = node
+            else:
+                parent.left = node
+
+            if left:
+                stack.append((left, sorted(v for s, e, _ in left for v in (s, e)), node, False))
+            if right:
+                stack.append((right, sorted(v for s, e, _ in right for v in (s, e)), node, True))
+        return root
+
+    def __len__(self) -> int:
+        return self.size
+
+    def at(self, time: float) -> List[int]:
+        """在 time 时刻生效的区间"""
+        return self.overlapping(time, time)
+
+    def overlapping(self, start: float, end: float) -> List[int]:
+        """与 [start, end] 有交集的区间"""
+        found = []
+        node = self._root
+        pending = []
+        while node is not None or pending:
+            if node is None:
+                node = pending.pop()
+
+            if end < node.center:
+                # 节点上的区间都覆盖 center，只需开始时间不晚于 end
+                for item in node.by_start:
+                    if item[0] > end:
+                        break
+                    found.append(item[2])
+                node = node.left
+            elif start > node.center:
+                # 只需结束时间不早于 start
+                for item in node.by_end:
+                    if item[1] < start:
+                        break
+                    found.append(item[2])
+                node = node.right
+            else:
+                # 查询区间包含 center，节点上的区间全部命中
+                found.extend(item[2] for item in node.by_start)
+                if node.right is not None:
+                    pending.append(node.right)
+                node = node.left
+        return found